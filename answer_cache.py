@@ -0,0 +1,112 @@
+"""Semantic answer cache that skips the LLM call for near-duplicate questions.
+
+Each entry keeps the query embedding, the IDs of the chunks that were
+retrieved for it, the prompt template type and the raw LLM answer. A new
+question reuses an answer when its embedding is close enough to a cached one
+and retrieval brought back (mostly) the same chunks. Entries belong to one
+collection version and are dropped as soon as the collection changes.
+"""
+import os
+import threading
+
+import numpy as np
+
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_MIN_OVERLAP = float(os.getenv("ANSWER_CACHE_MIN_OVERLAP", "0.6"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "500"))
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _overlap(a, b):
+    """Jaccard overlap between two collections of chunk IDs."""
+    a, b = set(a), set(b)
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class SemanticAnswerCache:
+    """Small in-memory vector cache of answered questions."""
+
+    def __init__(self, threshold=ANSWER_CACHE_THRESHOLD, min_overlap=ANSWER_CACHE_MIN_OVERLAP,
+                 max_entries=ANSWER_CACHE_SIZE):
+        self.threshold = threshold
+        self.min_overlap = min_overlap
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._version = None
+        self._vectors = None  # (n, dim) matrix of unit query embeddings
+        self._entries = []
+        self.hits = 0
+        self.misses = 0
+
+    def _check_version(self, collection_version):
+        """Drops everything if the collection changed. Caller holds the lock."""
+        if collection_version != self._version:
+            self._version = collection_version
+            self._vectors = None
+            self._entries = []
+
+    def lookup(self, query_embedding, chunk_ids, template_type, collection_version):
+        """Returns a cached raw answer for a near-duplicate question, or None.
+
+        Lexical-only retrievals have no query embedding and always miss.
+        """
+        if query_embedding is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        query = _unit(query_embedding)
+        with self._lock:
+            self._check_version(collection_version)
+            if self._vectors is None or self._vectors.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+            similarities = self._vectors @ query
+            for index in np.argsort(-similarities):
+                if similarities[index] < self.threshold:
+                    break
+                entry = self._entries[index]
+                if entry["template_type"] != template_type:
+                    continue
+                if _overlap(entry["chunk_ids"], chunk_ids) < self.min_overlap:
+                    continue
+                self.hits += 1
+                return entry["answer"]
+            self.misses += 1
+            return None
+
+    def store(self, query_embedding, chunk_ids, template_type, collection_version, answer):
+        if query_embedding is None:
+            return
+        query = _unit(query_embedding)
+        with self._lock:
+            self._check_version(collection_version)
+            if self._vectors is not None and self._vectors.shape[1] != query.shape[0]:
+                self._vectors = None
+                self._entries = []
+            entry = {"chunk_ids": list(chunk_ids), "template_type": template_type, "answer": answer}
+            if self._vectors is None:
+                self._vectors = query[np.newaxis, :]
+            else:
+                self._vectors = np.vstack([self._vectors, query])
+            self._entries.append(entry)
+            # Oldest entries go first once the cache is full
+            if len(self._entries) > self.max_entries:
+                overflow = len(self._entries) - self.max_entries
+                self._vectors = self._vectors[overflow:]
+                self._entries = self._entries[overflow:]
+
+    def clear(self):
+        with self._lock:
+            self._vectors = None
+            self._entries = []
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
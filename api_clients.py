@@ -0,0 +1,283 @@
+"""Shared, pooled clients for the Gemini APIs.
+
+One google.genai client per API key serves both generation and embeddings,
+so every session and thread reuses the same HTTP connection pool. Every
+upstream call:
+
+- waits for a process-wide slot: UPSTREAM_GENERATE_CONCURRENCY for answers
+  and UPSTREAM_EMBED_CONCURRENCY for embeddings. A streamed answer holds its
+  slot until the last chunk, so separate limits keep long generations from
+  starving the short embedding calls that every question starts with,
+- is retried with jittered exponential backoff on 429s, 5xx responses and
+  connection errors (up to API_MAX_RETRIES times),
+- is coalesced with an identical call already in flight (single-flight), so
+  fifty users asking the same question at once cause one upstream request.
+  Streamed answers are replayed chunk by chunk to everyone who joined,
+  and finish for them even if the caller who started the stream stops reading.
+
+GEMINI_BASE_URL sends all calls to another endpoint, e.g. stub_gemini_server.py
+for testing against injected latency and errors.
+"""
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+import httpx
+from google import genai
+from google.genai import types
+from langchain_core.embeddings import Embeddings
+
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL")
+UPSTREAM_CONCURRENCY = int(os.getenv("UPSTREAM_CONCURRENCY", "8"))  # Default for both limits below
+UPSTREAM_GENERATE_CONCURRENCY = int(os.getenv("UPSTREAM_GENERATE_CONCURRENCY", str(UPSTREAM_CONCURRENCY)))
+UPSTREAM_EMBED_CONCURRENCY = int(os.getenv("UPSTREAM_EMBED_CONCURRENCY", str(UPSTREAM_CONCURRENCY)))
+API_MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", "4"))
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 20.0
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+_generate_slots = threading.BoundedSemaphore(UPSTREAM_GENERATE_CONCURRENCY)
+_embed_slots = threading.BoundedSemaphore(UPSTREAM_EMBED_CONCURRENCY)
+
+
+def is_retryable(error):
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if code in RETRYABLE_STATUS_CODES:
+        return True
+    return isinstance(error, (ConnectionError, TimeoutError, httpx.TransportError))
+
+
+def backoff_delay(attempt):
+    """Full jitter: anywhere between zero and the capped exponential delay."""
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def call_upstream(slots, fn, *args, **kwargs):
+    """Calls fn in one of the given upstream slots, retrying retryable failures with backoff."""
+    for attempt in range(API_MAX_RETRIES + 1):
+        try:
+            with slots:
+                return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == API_MAX_RETRIES or not is_retryable(e):
+                raise
+            delay = backoff_delay(attempt)
+            print(f"Gemini call failed ({e}); retry {attempt + 1}/{API_MAX_RETRIES} in {delay:.2f}s")
+            time.sleep(delay)
+
+
+def stream_upstream(slots, fn, *args, **kwargs):
+    """call_upstream for streaming calls; only retried while nothing has been yielded yet."""
+    for attempt in range(API_MAX_RETRIES + 1):
+        started = False
+        try:
+            with slots:
+                for chunk in fn(*args, **kwargs):
+                    started = True
+                    yield chunk
+            return
+        except Exception as e:
+            if started or attempt == API_MAX_RETRIES or not is_retryable(e):
+                raise
+            delay = backoff_delay(attempt)
+            print(f"Gemini stream failed ({e}); retry {attempt + 1}/{API_MAX_RETRIES} in {delay:.2f}s")
+            time.sleep(delay)
+
+
+class _Flight:
+    """Chunks of one upstream call, replayed to every caller that joined it."""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.followers = 0  # Only changed under SingleFlight._lock
+        self._condition = threading.Condition()
+
+    def add(self, chunk):
+        with self._condition:
+            self.chunks.append(chunk)
+            self._condition.notify_all()
+
+    def finish(self, error=None):
+        with self._condition:
+            self.done = True
+            self.error = error
+            self._condition.notify_all()
+
+    def replay(self):
+        index = 0
+        while True:
+            with self._condition:
+                while index >= len(self.chunks) and not self.done:
+                    self._condition.wait()
+                if index < len(self.chunks):
+                    chunk = self.chunks[index]
+                elif self.error is not None:
+                    raise self.error
+                else:
+                    return
+            index += 1
+            yield chunk
+
+
+class SingleFlight:
+    """Lets concurrent identical calls share one upstream request."""
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def stream(self, key, start):
+        """Yields the chunks of start()'s iterator, shared with concurrent callers using the same key."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.leaders += 1
+            else:
+                flight.followers += 1
+                self.followers += 1
+        if not leader:
+            yield from flight.replay()
+            return
+        upstream = iter(start())
+        handed_off = False
+        try:
+            for chunk in upstream:
+                flight.add(chunk)
+                yield chunk
+            flight.finish()
+        except Exception as e:
+            flight.finish(e)
+            raise
+        except BaseException:
+            # The leading caller stopped reading early, e.g. Streamlit stopped its
+            # script for a rerun. Callers who joined still get the whole answer.
+            with self._lock:
+                handed_off = flight.followers > 0
+                if not handed_off:
+                    self._flights.pop(key, None)
+            if handed_off:
+                threading.Thread(
+                    target=self._finish_flight, args=(key, flight, upstream), name="single-flight", daemon=True
+                ).start()
+            else:
+                flight.finish(RuntimeError("Upstream call was abandoned"))
+                # Nobody is left to read it; free the upstream slot now
+                getattr(upstream, "close", lambda: None)()
+            raise
+        finally:
+            if not handed_off:
+                with self._lock:
+                    if self._flights.get(key) is flight:
+                        del self._flights[key]
+
+    def _finish_flight(self, key, flight, upstream):
+        """Reads the rest of an abandoned leader's upstream call for its followers."""
+        try:
+            for chunk in upstream:
+                flight.add(chunk)
+            flight.finish()
+        except Exception as e:
+            flight.finish(e)
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+
+    def call(self, key, fn):
+        """Returns fn(), shared with concurrent callers using the same key."""
+        return list(self.stream(key, lambda: iter([fn()])))[0]
+
+
+_flights = SingleFlight()
+
+
+def _request_key(kind, model, contents, config):
+    def dump(value):
+        if hasattr(value, "model_dump_json"):
+            return value.model_dump_json()
+        if isinstance(value, (list, tuple)):
+            return "[" + ",".join(dump(item) for item in value) + "]"
+        return json.dumps(value, sort_keys=True, default=str)
+    return hashlib.sha1(f"{kind}|{model}|{dump(contents)}|{dump(config)}".encode("utf-8")).hexdigest()
+
+
+class PooledModels:
+    """The subset of genai's client.models the app uses, with limits, retries and coalescing."""
+
+    def __init__(self, models):
+        self._models = models
+
+    def generate_content(self, *, model, contents, config=None):
+        key = _request_key("generate", model, contents, config)
+        return _flights.call(key, lambda: call_upstream(
+            _generate_slots, self._models.generate_content, model=model, contents=contents, config=config
+        ))
+
+    def generate_content_stream(self, *, model, contents, config=None):
+        key = _request_key("stream", model, contents, config)
+        return _flights.stream(key, lambda: stream_upstream(
+            _generate_slots, self._models.generate_content_stream, model=model, contents=contents, config=config
+        ))
+
+    def embed_content(self, *, model, contents, config=None):
+        key = _request_key("embed", model, contents, config)
+        return _flights.call(key, lambda: call_upstream(
+            _embed_slots, self._models.embed_content, model=model, contents=contents, config=config
+        ))
+
+
+class PooledClient:
+    """Stands in for genai.Client; one per API key and process."""
+
+    def __init__(self, client):
+        self.client = client
+        self.models = PooledModels(client.models)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_genai_client(api_key):
+    """Returns the process-wide pooled client for an API key."""
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            http_options = types.HttpOptions(base_url=GEMINI_BASE_URL) if GEMINI_BASE_URL else None
+            client = PooledClient(genai.Client(api_key=api_key, http_options=http_options))
+            _clients[api_key] = client
+        return client
+
+
+def stats():
+    """Coalescing counters, for logging and benchmarks."""
+    return {"upstream_calls": _flights.leaders, "coalesced_calls": _flights.followers}
+
+
+class GeminiEmbeddings(Embeddings):
+    """Gemini embeddings through the pooled client, so they share its limits and retries."""
+
+    def __init__(self, model, api_key):
+        self.model = model
+        self.client = get_genai_client(api_key)
+
+    def _embed(self, texts, task_type):
+        result = self.client.models.embed_content(
+            model=self.model, contents=texts, config=types.EmbedContentConfig(task_type=task_type)
+        )
+        return [list(embedding.values) for embedding in result.embeddings]
+
+    def embed_documents(self, texts):
+        return self._embed(list(texts), "RETRIEVAL_DOCUMENT") if texts else []
+
+    def embed_query(self, text):
+        return self._embed([text], "RETRIEVAL_QUERY")[0]
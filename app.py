@@ -7,175 +7,36 @@ except ImportError:
 
 
 
+import time
+_import_start = time.perf_counter()
+
 import streamlit as st
 import os
 import html
-from google import genai
-from google.genai import types
-from langchain_chroma import Chroma
-from langchain.prompts import ChatPromptTemplate
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-import time
-from dotenv import load_dotenv
-import PyPDF2  # Agar PDF support chahiye
-
-# Load environment variables
-load_dotenv()
-
-class EventAssistantRAGBot:
-    def __init__(self, api_key, chroma_path="/chroma", template_type="event"):
-        self.api_key = api_key
-        self.chroma_path = chroma_path
-        # Initialize Gemini client
-        self.client = genai.Client(api_key=self.api_key)
-        self.set_prompt_template(template_type)
-
-    def set_prompt_template(self, template_type="event"):
-        if template_type == "resume":
-            self.prompt_template = """
-            You are a helpful Resume Assistant. Your primary purpose is to answer questions about the uploaded resume described in the provided context. Follow these guidelines:
-
-            1. Only provide details that are present in the resume context.
-            2. If information is not in the context, politely say "Sorry, this information is not available in the uploaded resume."
-            3. Keep responses concise and factual.
-            4. Do not make assumptions beyond what's in the resume.
-            5. Refer to yourself as "Resume Assistant".
-
-            Resume context:
-            {context}
-            --------
-            Now, please answer this question about the resume: {question}
-            """
-        else:
-            self.prompt_template = """
-            You are a friendly Event Information Assistant. Your primary purpose is to answer questions about the event described in the provided context. Follow these guidelines:
-
-            1. You can respond to basic greetings like "hi", "hello", or "how are you" in a warm, welcoming manner
-            2. For event information, only provide details that are present in the context
-            3. If information is not in the context, politely say "I'm sorry, I don't have that specific information about the event"
-            4. Keep responses concise but conversational
-            5. Do not make assumptions beyond what's explicitly stated in the context
-            6. Always prioritize factual accuracy while maintaining a helpful tone
-            7. Do not introduce information that isn't in the context
-            8. If unsure about any information, acknowledge uncertainty rather than guess
-            9. You may suggest a few general questions users might want to ask about the event
-            10. Remember to maintain a warm, friendly tone in all interactions
-            11. You should refer to yourself as "Event Bot"
-            12. You should not greet if the user has not greeted to you
-
-            Remember: While you can be conversational, your primary role is providing accurate information about this specific event based on the context provided.
-
-            Context information about the event:
-            {context}
-            --------
-            
-            Now, please answer this question about the event: {question}
-            """
-
-    def post_process_response(self, response, query):
-        """Format responses for better readability based on query type."""
-        # If it's a lunch-related query, format the response
-        if "lunch" in query.lower() or "food" in query.lower() or "eat" in query.lower():
-            # Just start with "Regarding lunch:" without the greeting
-            formatted = "Regarding lunch:\n\n"
-            
-            # Split into readable bullet points
-            points = []
-            
-            # Extract key information using common phrases and format as separate points
-            if "provided to all" in response:
-                points.append("• Lunch will be provided to all participants who have checked in at the venue.")
-            if "cafeteria" in response.lower() and "floor" in response.lower():
-                # Extract time info if available
-                time_info = ""
-                if "1:00" in response and "2:00" in response:
-                    time_info = "between 1:00 PM and 2:00 PM IST"
-                points.append(f"• It will be served in the Cafeteria on the 5th floor {time_info}.")
-            if "check-in" in response.lower() or "registration" in response.lower():
-                points.append("• Please ensure you've completed the check-in process at the registration desk to be eligible.")
-            if "volunteer" in response.lower() or "direction" in response.lower():
-                points.append("• Feel free to ask a volunteer if you need directions to the cafeteria.")
-                
-            # If we couldn't extract structured points, just use the original
-            if not points:
-                return response
-                
-            # Combine all points with line breaks
-            return formatted + "\n".join(points)
-        
-        # For other responses, just return the original
-        return response
-
-    def answer_question(self, query):
-        """Use RAG with Google Gemini to answer a question based on retrieved context."""
-        vector_db_time = 0
-        llm_time = 0
-        try:
-            with st.spinner("Retrieving relevant information..."):
-                start_time = time.time()
-                # Using Google embeddings
-                embedding_function = GoogleGenerativeAIEmbeddings(
-                    model="models/embedding-001",
-                    google_api_key=self.api_key
-                )
-                
-                # Retrieve relevant documents from Chroma
-                db = Chroma(persist_directory=self.chroma_path, embedding_function=embedding_function)
-                results = db.similarity_search_with_score(query, k=5)
-                context_text = "\n\n --- \n\n".join([doc.page_content for doc, _score in results])
-                end_time = time.time()
-                vector_db_time = end_time - start_time
-
-                # --- ADD THIS: If no relevant context found, return custom message ---
-                if not context_text.strip():
-                    return {
-                        "text": "File me aisi jankari nahi hai.",
-                        "vector_db_time": vector_db_time,
-                        "llm_time": 0
-                    }
-                # --- END ADD ---
-
-                # Format the prompt
-                prompt_template = ChatPromptTemplate.from_template(self.prompt_template)
-                prompt = prompt_template.format(context=context_text, question=query)
-                
-                # Create the content for Gemini
-                contents = [
-                    types.Content(
-                        role="user",
-                        parts=[
-                            types.Part.from_text(text=prompt),
-                        ],
-                    ),
-                ]
-            
-            with st.spinner("Generating response..."):
-                start_time = time.time()
-                # Generate response using Gemini 2.0 Flash model
-                response = self.client.models.generate_content(
-                    model="gemini-2.0-flash",  # Using Gemini 2.0 Flash model
-                    contents=contents,
-                )
-                end_time = time.time()
-                llm_time = end_time - start_time
-                
-                raw_response_text = response.text
-                processed_response_text = self.post_process_response(raw_response_text, query)
-                
-                # Return a dictionary including the text and timings
-                return {
-                    "text": processed_response_text,
-                    "vector_db_time": vector_db_time,
-                    "llm_time": llm_time
-                }
-                
-        except Exception as e:
-            # In case of error, return the error message but with zero timings
-            return {
-                "text": f"An error occurred: {str(e)}",
-                "vector_db_time": vector_db_time,
-                "llm_time": llm_time
-            }
+import uuid
+import hashlib
+
+import environment
+from tracing import start_metrics_server
+
+# Answer and index uploads through a running query_service.py instead of in this
+# process; the app then never loads Chroma, LangChain or the Gemini client
+QUERY_SERVICE_URL = os.getenv("QUERY_SERVICE_URL")
+if QUERY_SERVICE_URL:
+    from query_client import RemoteRAGBot, delete_remote_collection, start_remote_upload
+else:
+    from rag_bot import EventAssistantRAGBot
+    from retriever import DEFAULT_COLLECTION, SESSION_COLLECTION_PREFIX, cleanup_expired_collections, delete_collection
+    from uploads import start_upload_job
+    from warmup import start_warm_up
+
+# Only meaningful on the script's first run in this process; later reruns find the modules loaded
+import_seconds = time.perf_counter() - _import_start
+
+# Per-stage latency histograms on http://127.0.0.1:$METRICS_PORT/metrics, if configured
+start_metrics_server()
+
+CHAT_HISTORY_WINDOW = 20  # Messages rendered before "Load older messages" is shown
 
 # Set page configuration
 st.set_page_config(
@@ -300,48 +161,118 @@ st.title("Build with AI - RAG Event Bot")
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
-# Get API key from environment variables
+# Get API key from environment variables (the query service has its own)
 api_key =  os.getenv("GEMINI_API_KEY")
-if not api_key:
+if not api_key and not QUERY_SERVICE_URL:
     st.error("API key not found in .env file. Please add GEMINI_API_KEY to your .env file.")
     st.stop()
 
+# Open the index and compile the prompts in the background, once per server process
+# (the query service warms itself up)
+if os.path.exists("chroma") and not QUERY_SERVICE_URL:
+    start_warm_up("chroma", api_key, import_seconds=import_seconds)
+
+# Each session gets its own namespace for uploaded files
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex[:16]
+    # The query service cleans up when it receives uploads
+    if os.path.exists("chroma") and not QUERY_SERVICE_URL:
+        cleanup_expired_collections("chroma")
+
+def create_bot(collection_name=None):
+    """The session's bot: a query service client, or the in-process pipeline."""
+    if QUERY_SERVICE_URL:
+        return RemoteRAGBot(QUERY_SERVICE_URL, collection_name=collection_name)
+    return EventAssistantRAGBot(api_key, "chroma", collection_name=collection_name or DEFAULT_COLLECTION)
+
+def start_upload(file_bytes, filename, content_hash):
+    """Indexes an upload in the background; returns a job with progress, message and done."""
+    if QUERY_SERVICE_URL:
+        return start_remote_upload(QUERY_SERVICE_URL, st.session_state.session_id, file_bytes, filename, content_hash)
+    return start_upload_job("chroma", api_key, st.session_state.session_id, file_bytes, filename, content_hash)
+
+def drop_upload_collection(collection_name):
+    """Deletes a session's earlier upload; the default collection is never deleted."""
+    if QUERY_SERVICE_URL:
+        if collection_name is not None:
+            delete_remote_collection(QUERY_SERVICE_URL, collection_name)
+    elif collection_name.startswith(SESSION_COLLECTION_PREFIX):
+        delete_collection("chroma", collection_name)
+
+def drop_replaced_uploads():
+    """Deletes the collections of uploads replaced by a newer one, once they finish indexing."""
+    still_indexing = []
+    for job in st.session_state.get("replaced_upload_jobs", []):
+        if not job.done:
+            still_indexing.append(job)
+        elif job.collection_name != st.session_state.bot.collection_name:
+            drop_upload_collection(job.collection_name)
+    st.session_state.replaced_upload_jobs = still_indexing
+
 # Initialize the bot
 if "bot" not in st.session_state:
     chroma_path = "chroma"
-    if not os.path.exists(chroma_path):
+    if not os.path.exists(chroma_path) and not QUERY_SERVICE_URL:
         st.error(f"Chroma directory '{chroma_path}' not found. Make sure your vector database is properly set up.")
         st.stop()
     
     with st.spinner("Initializing assistant..."):
-        st.session_state.bot = EventAssistantRAGBot(api_key, chroma_path)
+        st.session_state.bot = create_bot()
+
+# Switch to a freshly indexed upload only once its collection is complete
+upload_job = st.session_state.get("upload_job")
+if upload_job is not None and upload_job.done:
+    st.session_state.upload_job = None
+    if upload_job.error:
+        st.error(upload_job.message)
+        # Let the same file be attached again to retry, e.g. after a rate limit; a fresh
+        # uploader widget keeps the still attached file from retrying on every rerun
+        st.session_state.upload_hash = None
+        st.session_state.uploader_key = st.session_state.get("uploader_key", 0) + 1
+        # A partly indexed collection is never used
+        if upload_job.collection_name != st.session_state.bot.collection_name:
+            drop_upload_collection(upload_job.collection_name)
+    else:
+        previous_collection = st.session_state.bot.collection_name
+        st.session_state.bot = create_bot(upload_job.collection_name)
+        st.session_state.messages = []
+        st.session_state.history_window = CHAT_HISTORY_WINDOW
+        if previous_collection != upload_job.collection_name:
+            drop_upload_collection(previous_collection)
+        st.success(f"File content database me sirf aapki nayi file ka data hai! ({upload_job.num_chunks} chunks)")
+drop_replaced_uploads()
 
 # Custom Chat UI Implementation
-chat_html = '<div class="custom-chat-container">'
-
-# Add all messages to the custom chat HTML
-for message in st.session_state.messages:
+def render_message_html(message):
+    """Builds the chat bubble HTML for one message."""
+    message_html = ""
     if message["role"] == "user":
         avatar = '<div class="avatar-icon user-avatar-icon">👤</div>'
-        chat_html += f'<div class="message-container user">'
-        chat_html += avatar
+        message_html += f'<div class="message-container user">'
+        message_html += avatar
         # User messages are simple text
-        chat_html += f'<div class="user-message">{html.escape(message["content"])}</div>'
-        chat_html += '</div>'
+        message_html += f'<div class="user-message">{html.escape(message["content"])}</div>'
+        message_html += '</div>'
     else:  # assistant
         avatar = '<div class="avatar-icon">🤖</div>'
         # We apply the bot-message class to the INNER div now, which contains content and timings
-        chat_html += f'<div class="message-container">'
-        chat_html += avatar
+        message_html += f'<div class="message-container">'
+        message_html += avatar
         
         # Access the content dictionary
         content_dict = message["content"]
         content_text = content_dict["text"]
         vector_db_time = content_dict.get("vector_db_time")
         llm_time = content_dict.get("llm_time")
+        first_token_time = content_dict.get("first_token_time")
+        retriever_stats = content_dict.get("retriever")
+        answer_cached = content_dict.get("answer_cached", False)
+        intent = content_dict.get("intent")
+        trace = content_dict.get("trace")
+        tokens = content_dict.get("tokens")
 
         # Start the inner bot message div that holds both content and timings
-        chat_html += '<div class="bot-message">'
+        message_html += '<div class="bot-message">'
         
         # Format message content - Special handling for the welcome message
         if "I can help you with the following:" in content_text:
@@ -359,27 +290,78 @@ for message in st.session_state.messages:
             welcome_html = welcome_html.replace('\n6. ', "</li><li style='margin-bottom:4px;'>")
             welcome_html = welcome_html.replace('\n\nHow can I help you', "</li></ol><br>How can I help you")
             
-            chat_html += '<div class="bot-message-content">' + welcome_html + '</div>'
+            message_html += '<div class="bot-message-content">' + welcome_html + '</div>'
 
         else:
             # For regular messages - escape and format text content
             escaped_content = html.escape(content_text)
             formatted_content = escaped_content.replace('\n', '<br>')
             
-            chat_html += f'<div class="bot-message-content">{formatted_content}</div>'
+            message_html += f'<div class="bot-message-content">{formatted_content}</div>'
         
         # Add timings if available (not for the welcome message which has None)
         if vector_db_time is not None and llm_time is not None:
-             timings_html = f'<span class="bot-message-timings">Vector DB: {vector_db_time:.2f}s | LLM: {llm_time:.2f}s</span>'
-             chat_html += timings_html
+             # Show whether this answer paid for opening the shared store
+             if retriever_stats and retriever_stats.get("cold"):
+                 retriever_label = f" (cold, open {retriever_stats['open_time']:.2f}s)"
+             elif retriever_stats:
+                 retriever_label = " (warm)"
+             else:
+                 retriever_label = ""
+             # Keyword-only answers skipped the embedding call
+             if retriever_stats and retriever_stats.get("mode") == "lexical":
+                 retriever_label += " (keyword match)"
+             if intent:
+                 llm_label = f"instant reply ({intent})"
+             elif answer_cached:
+                 llm_label = "cached answer"
+             else:
+                 llm_label = f"{llm_time:.2f}s"
+             # Streamed answers also show how long the user waited for the first words
+             if first_token_time is not None:
+                 llm_label += f" | First token: {first_token_time:.2f}s"
+             # What the LLM call cost, so prompt changes can be compared
+             if tokens:
+                 approx = "~" if tokens.get("estimated") else ""
+                 cached = f" ({tokens['cached']} cached)" if tokens.get("cached") else ""
+                 llm_label += f" | Tokens: {approx}{tokens['prompt']} in{cached}, {approx}{tokens['output']} out"
+             # Per-stage breakdown on hover
+             stage_title = ""
+             if trace:
+                 stage_title = " · ".join(f"{span['name']} {span['duration'] * 1000:.0f}ms" for span in trace["spans"])
+             timings_html = (
+                 f'<span class="bot-message-timings" title="{html.escape(stage_title)}">'
+                 f'Vector DB: {vector_db_time:.2f}s{retriever_label} | LLM: {llm_label}</span>'
+             )
+             message_html += timings_html
 
         # Close the inner bot message div
-        chat_html += '</div>' # Closes bot-message
+        message_html += '</div>' # Closes bot-message
 
-        chat_html += '</div>' # Closes message-container
+        message_html += '</div>' # Closes message-container
 
-# Close the container div
-chat_html += '</div>'
+    return message_html
+
+def cached_message_html(message):
+    """Returns a message's chat bubble HTML, rendering it only the first time."""
+    if "html" not in message:
+        message["html"] = render_message_html(message)
+    return message["html"]
+
+# Only the most recent messages are sent to the browser; older ones on demand
+if "history_window" not in st.session_state:
+    st.session_state.history_window = CHAT_HISTORY_WINDOW
+
+hidden_messages = len(st.session_state.messages) - st.session_state.history_window
+if hidden_messages > 0:
+    if st.button(f"Load older messages ({hidden_messages} hidden)"):
+        st.session_state.history_window += CHAT_HISTORY_WINDOW
+        st.rerun()
+visible_messages = st.session_state.messages[max(hidden_messages, 0):]
+
+chat_html = '<div class="custom-chat-container">' + "".join(
+    cached_message_html(message) for message in visible_messages
+) + '</div>'
 
 # Render the custom chat container
 st.markdown(chat_html, unsafe_allow_html=True)
@@ -390,9 +372,32 @@ user_input = st.chat_input("Ask a question about the event...")
 if user_input:
     # Add user message to chat history
     st.session_state.messages.append({"role": "user", "content": user_input})
-    
+
+    # Show the question right away and fill in the answer as it streams
+    user_message_html = cached_message_html(st.session_state.messages[-1])
+    streaming_placeholder = st.empty()
+    streaming_placeholder.markdown(
+        f'<div class="custom-chat-container">{user_message_html}</div>', unsafe_allow_html=True
+    )
+
+    def show_partial_answer(partial_text):
+        partial_html = render_message_html({"role": "assistant", "content": {"text": partial_text}})
+        streaming_placeholder.markdown(
+            f'<div class="custom-chat-container">{user_message_html}{partial_html}</div>',
+            unsafe_allow_html=True
+        )
+
+    # Which phase the bot is in while it works
+    status_placeholder = st.empty()
+
+    def show_status(message):
+        status_placeholder.caption(message)
+
     # Generate response (this now returns a dict)
-    response_dict = st.session_state.bot.answer_question(user_input)
+    response_dict = st.session_state.bot.answer_question(
+        user_input, on_token=show_partial_answer, on_status=show_status
+    )
+    status_placeholder.empty()
     
     # Add assistant response (the dict) to chat history
     st.session_state.messages.append({"role": "assistant", "content": response_dict})
@@ -400,44 +405,34 @@ if user_input:
     # Rerun to update the UI
     st.rerun()
 
-uploaded_file = st.file_uploader("Apni file upload karein (PDF, TXT, DOCX)", type=["pdf", "txt", "docx"])
+uploaded_file = st.file_uploader(
+    "Apni file upload karein (PDF, TXT, DOCX)", type=["pdf", "txt", "docx"],
+    key=f"uploader_{st.session_state.get('uploader_key', 0)}"
+)
 
-user_file_text = ""
-chroma_path = "chroma"
+@st.fragment(run_every=1)
+def show_upload_progress():
+    """Polls the background upload job without blocking the chat."""
+    drop_replaced_uploads()
+    job = st.session_state.get("upload_job")
+    if job is None:
+        return  # Only waiting for replaced uploads to finish
+    if job.done:
+        # Full rerun so the bot switch at the top of the script happens
+        st.rerun()
+    st.progress(job.progress, text=job.message)
 
 if uploaded_file is not None:
-    filename = uploaded_file.name.lower()
-    if filename.endswith(".pdf"):
-        try:
-            reader = PyPDF2.PdfReader(uploaded_file)
-            user_file_text = "\n".join([page.extract_text() for page in reader.pages])
-        except Exception as e:
-            st.error(f"PDF read error: {e}")
-    elif filename.endswith(".txt"):
-        user_file_text = uploaded_file.read().decode("utf-8")
-    elif filename.endswith(".docx"):
-        try:
-            import docx
-            doc = docx.Document(uploaded_file)
-            user_file_text = "\n".join([para.text for para in doc.paragraphs])
-        except Exception as e:
-            st.error(f"DOCX read error: {e}")
-
-    if user_file_text.strip():
-        embedding_function = GoogleGenerativeAIEmbeddings(
-            model="models/embedding-001",
-            google_api_key=api_key
-        )
-        db = Chroma(persist_directory=chroma_path, embedding_function=embedding_function)
-        db.delete_collection()  # Clear all previous data
-
-        # --- IMPORTANT: Re-initialize Chroma instance after delete ---
-        db = Chroma(persist_directory=chroma_path, embedding_function=embedding_function)
-
-        # Now add only the new file's content
-        db.add_texts([user_file_text], metadatas=[{"source": "user_upload"}])
-        st.success("File content database me sirf aapki nayi file ka data hai!")
-
-        # Refresh the bot's ChromaDB instance and clear chat
-        st.session_state.bot = EventAssistantRAGBot(api_key, chroma_path)
-        st.session_state.messages = []
\ No newline at end of file
+    # uploaded_file stays set across reruns, so only index bytes we haven't seen yet
+    file_bytes = uploaded_file.getvalue()
+    content_hash = hashlib.sha256(file_bytes).hexdigest()
+    if content_hash != st.session_state.get("upload_hash"):
+        st.session_state.upload_hash = content_hash
+        # A file replaced while it is still indexing is deleted once its job finishes
+        if st.session_state.get("upload_job") is not None:
+            st.session_state.setdefault("replaced_upload_jobs", []).append(st.session_state.upload_job)
+        st.session_state.upload_job = start_upload(file_bytes, uploaded_file.name, content_hash)
+
+# The fragment keeps ticking only while it is rendered, i.e. while a job exists
+if st.session_state.get("upload_job") is not None or st.session_state.get("replaced_upload_jobs"):
+    show_upload_progress()
@@ -0,0 +1,183 @@
+"""Answers a JSONL file of questions without the Streamlit UI.
+
+Runs EventAssistantRAGBot.answer_question from a pool of worker threads
+against the same Chroma store the app uses, with token-bucket rate limits
+on the embedding and Gemini calls, and writes one JSONL result per question
+(in input order) with the answer and per-stage timings. Use it to pre-warm
+the embedding cache before an event, or to regression-test answers and
+latency at scale. A summary goes to stderr.
+
+    python batch_qa.py questions.jsonl --output answers.jsonl --workers 8 --llm-rate 2
+
+Each input line is either a JSON string or an object with a question, query
+or text field; other fields (e.g. an id or expected answer) are copied to
+the output.
+"""
+import sys
+try:
+    __import__('pysqlite3')
+    sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
+except ImportError:
+    pass
+
+import argparse
+import contextlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import environment
+from rag_bot import EventAssistantRAGBot
+from rate_limit import TokenBucket
+from retriever import DEFAULT_COLLECTION
+
+_thread_state = threading.local()  # Seconds the current question spent waiting on the rate limiters
+
+
+def _wait(bucket):
+    _thread_state.wait = getattr(_thread_state, "wait", 0.0) + bucket.acquire()
+
+
+class _RateLimitedModels:
+    def __init__(self, models, bucket):
+        self.models = models
+        self.bucket = bucket
+
+    def generate_content(self, **kwargs):
+        _wait(self.bucket)
+        return self.models.generate_content(**kwargs)
+
+    def generate_content_stream(self, **kwargs):
+        _wait(self.bucket)
+        return self.models.generate_content_stream(**kwargs)
+
+
+class RateLimitedClient:
+    """Wraps a google.genai client so every generate call takes a token from the bucket."""
+
+    def __init__(self, client, bucket):
+        self.models = _RateLimitedModels(client.models, bucket)
+
+
+def read_questions(path):
+    """Reads the input JSONL into records that all have a "question" field."""
+    records = []
+    with open(path) as file:
+        for line_number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {"question": record}
+            question = next((record[key] for key in ("question", "query", "text") if record.get(key)), None)
+            if question is None:
+                print(f"Skipping line {line_number}: no question, query or text field", file=sys.stderr)
+                continue
+            record["question"] = question
+            records.append(record)
+    return records
+
+
+def answer_record(bot, record, stream=False):
+    """Answers one question and returns its output record."""
+    _thread_state.wait = 0.0
+    start_time = time.perf_counter()
+    # Streaming only changes what is measured: the first token time
+    response = bot.answer_question(record["question"], on_token=(lambda text: None) if stream else None)
+    total_time = time.perf_counter() - start_time
+    trace = response["trace"]
+    spans = {}
+    for span in trace["spans"]:
+        spans[span["name"]] = spans.get(span["name"], 0.0) + span["duration"]
+    retriever_stats = response.get("retriever") or {}
+    return {
+        **record,
+        "answer": response["text"],
+        "error": trace["attributes"].get("error"),
+        "intent": response.get("intent"),
+        "answer_cached": bool(response.get("answer_cached")),
+        "retrieval_mode": retriever_stats.get("mode"),
+        "timings": {
+            "total": total_time,
+            "vector_db": response["vector_db_time"],
+            "llm": response["llm_time"],
+            "first_token": response.get("first_token_time"),
+            "rate_limit_wait": _thread_state.wait,
+        },
+        "tokens": response.get("tokens"),
+        "spans": spans,
+    }
+
+
+def run(args, api_key, output):
+    """Answers the questions and writes the results to `output`."""
+    records = read_questions(args.input)
+    burst = args.burst or args.workers
+    embed_bucket = TokenBucket(args.embed_rate, burst)
+    llm_bucket = TokenBucket(args.llm_rate, burst)
+
+    # One bot for all workers: the retriever, its caches and the Gemini client are shared
+    bot = EventAssistantRAGBot(api_key, args.chroma, template_type=args.template, collection_name=args.collection)
+    bot.client = RateLimitedClient(bot.client, llm_bucket)
+    # Only query embeddings that miss the cache take a token, waiting in the worker thread
+    bot.retriever.embed_gate = lambda: _wait(embed_bucket)
+
+    start_time = time.perf_counter()
+    totals = []
+    errors = 0
+    with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="qa") as executor:
+        for result in executor.map(lambda record: answer_record(bot, record, args.stream), records):
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output.flush()
+            totals.append(result["timings"]["total"])
+            errors += result["error"] is not None
+    wall_time = time.perf_counter() - start_time
+
+    print(f"Answered {len(totals)} questions in {wall_time:.2f}s "
+          f"({len(totals) / wall_time if wall_time else 0:.2f}/s, {errors} errors)", file=sys.stderr)
+    if totals:
+        p50, p95, p99 = np.percentile(totals, [50, 95, 99])
+        print(f"Latency p50 {p50:.2f}s, p95 {p95:.2f}s, p99 {p99:.2f}s; rate limit waits: "
+              f"embeddings {embed_bucket.waited:.2f}s, Gemini {llm_bucket.waited:.2f}s", file=sys.stderr)
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions with the Event Bot.")
+    parser.add_argument("input", help="JSONL file with one question per line")
+    parser.add_argument("--output", default="-", help="Where to write the JSONL results (default: stdout)")
+    parser.add_argument("--workers", type=int, default=4, help="Questions answered at the same time")
+    parser.add_argument("--embed-rate", type=float, default=5.0, help="Embedding calls per second (0 = unlimited)")
+    parser.add_argument("--llm-rate", type=float, default=1.0, help="Gemini calls per second (0 = unlimited)")
+    parser.add_argument("--burst", type=float, default=None, help="Calls allowed in a burst (default: --workers)")
+    parser.add_argument("--chroma", default="chroma", help="Chroma directory")
+    parser.add_argument("--collection", default=DEFAULT_COLLECTION, help="Collection to query")
+    parser.add_argument("--template", choices=["event", "resume"], default="event", help="Prompt template")
+    parser.add_argument("--stream", action="store_true", help="Stream answers to measure time to first token")
+    args = parser.parse_args()
+
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        print("Error: GEMINI_API_KEY not found in .env file.", file=sys.stderr)
+        sys.exit(1)
+    if not os.path.exists(args.chroma):
+        print(f"Error: Chroma directory '{args.chroma}' not found. Run populatedb.py first.", file=sys.stderr)
+        sys.exit(1)
+
+    # The results may go to stdout; everything the bot prints along the way goes to stderr
+    output = open(args.output, "w") if args.output != "-" else sys.stdout
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            run(args, api_key, output)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
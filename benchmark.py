@@ -0,0 +1,317 @@
+"""Offline benchmark for ingestion and query latency.
+
+Runs the real populatedb.py functions and EventAssistantRAGBot.answer_question
+against synthetic PDF corpora of increasing size, with a deterministic local
+hashing embedding backend and a stub LLM, so no Gemini calls are made. Results are
+printed as JSON (or written with --output) so runs can be compared between
+commits; progress logs go to stderr.
+
+    python benchmark.py --sizes 10,50,200 --output bench.json
+    python benchmark.py --questions questions.jsonl --llm-latency 0.5
+"""
+import sys
+try:
+    __import__('pysqlite3')
+    sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
+except ImportError:
+    pass
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import tempfile
+import time
+
+_import_start = time.perf_counter()
+import numpy as np
+from langchain_chroma import Chroma
+
+from embedding_providers import get_embedding_provider
+from populatedb import StageStats, create_vector_database, iter_document_chunks
+from rag_bot import EventAssistantRAGBot
+from retriever import DEFAULT_COLLECTION
+from tracing import tracer
+from vector_store import DTYPES, VECTOR_STORE_DTYPE, export_vector_store
+from warmup import warm_up
+
+IMPORT_SECONDS = time.perf_counter() - _import_start
+
+ROOMS = ["Hall A", "Hall B", "Room 501", "Room 502", "Auditorium", "Cafeteria", "Lab 3", "Lounge"]
+FLOORS = ["ground floor", "2nd floor", "3rd floor", "5th floor"]
+TOPICS = ["Gemini", "RAG pipelines", "vector databases", "Streamlit", "prompt design",
+          "evaluation", "agents", "fine-tuning", "on-device models", "safety"]
+SPEAKERS = ["Asha Rao", "Vikram Shah", "Meera Iyer", "Rahul Nair", "Priya Das",
+            "Arjun Mehta", "Neha Kapoor", "Karan Singh"]
+TIMES = ["9:30 AM", "10:00 AM", "11:15 AM", "12:00 PM", "1:00 PM", "2:00 PM", "3:30 PM", "4:45 PM"]
+
+
+class _StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class _StubModels:
+    def __init__(self, latency, chunks):
+        self.latency = latency
+        self.chunks = chunks
+
+    def _answer(self, contents):
+        prompt = contents[-1].parts[0].text
+        return f"Stub answer based on {len(prompt)} prompt characters."
+
+    def generate_content(self, model, contents, **kwargs):
+        time.sleep(self.latency)
+        return _StubResponse(self._answer(contents))
+
+    def generate_content_stream(self, model, contents, **kwargs):
+        text = self._answer(contents)
+        step = max(1, len(text) // self.chunks)
+        for start in range(0, len(text), step):
+            time.sleep(self.latency / self.chunks)
+            yield _StubResponse(text[start:start + step])
+
+
+class StubLLMClient:
+    """Stands in for genai.Client: fixed latency, answer derived from the prompt."""
+
+    def __init__(self, latency=0.0, chunks=8):
+        self.models = _StubModels(latency, chunks)
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path, pages):
+    """Writes a minimal text-only PDF; `pages` is a list of lists of lines."""
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Pages, filled in once the page object numbers are known
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_refs = []
+    for lines in pages:
+        body = "BT /F1 10 Tf 40 760 Td 13 TL " + " ".join(f"({_pdf_escape(line)}) Tj T*" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(body.encode('latin-1'))} >>\nstream\n{body}\nendstream")
+        content_ref = len(objects)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_ref} 0 R >>"
+        )
+        page_refs.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(page_refs)}] /Count {len(page_refs)} >>"
+
+    output = b"%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref_offset = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for offset in offsets:
+        output += f"{offset:010d} 00000 n \n".encode("latin-1")
+    output += (f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+               f"startxref\n{xref_offset}\n%%EOF\n").encode("latin-1")
+    with open(path, "wb") as file:
+        file.write(output)
+
+
+def synthetic_sentence(rng):
+    return rng.choice([
+        f"The session on {rng.choice(TOPICS)} by {rng.choice(SPEAKERS)} starts at {rng.choice(TIMES)} in {rng.choice(ROOMS)}.",
+        f"{rng.choice(ROOMS)} is on the {rng.choice(FLOORS)} and opens at {rng.choice(TIMES)}.",
+        f"{rng.choice(SPEAKERS)} will answer questions about {rng.choice(TOPICS)} after the talk.",
+        f"Lunch is served in the Cafeteria on the {rng.choice(FLOORS)} between 1:00 PM and 2:00 PM.",
+        f"Volunteers near {rng.choice(ROOMS)} can help with directions and check-in.",
+    ])
+
+
+def synthetic_question(rng):
+    return rng.choice([
+        f"When does the {rng.choice(TOPICS)} session start?",
+        f"Where is {rng.choice(ROOMS)}?",
+        f"What is {rng.choice(SPEAKERS)} talking about?",
+        "Where is lunch served?",
+        f"Who is speaking in {rng.choice(ROOMS)} at {rng.choice(TIMES)}?",
+    ])
+
+
+def build_corpus(directory, num_docs, pages_per_doc, lines_per_page, seed):
+    """Writes `num_docs` synthetic event PDFs and returns their paths."""
+    rng = random.Random(seed)
+    paths = []
+    for doc_num in range(num_docs):
+        pages = [[synthetic_sentence(rng) for _ in range(lines_per_page)] for _ in range(pages_per_doc)]
+        path = os.path.join(directory, f"event_{doc_num:05d}.pdf")
+        write_pdf(path, pages)
+        paths.append(path)
+    return paths
+
+
+def load_questions(path):
+    """Reads questions from JSONL; uses the first of question/query/text/title found per line."""
+    questions = []
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                questions.append(record)
+                continue
+            for key in ("question", "query", "text", "title"):
+                if record.get(key):
+                    questions.append(record[key])
+                    break
+    return questions
+
+
+def percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99), "mean": float(np.mean(values))}
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_size(num_docs, questions, args):
+    """Ingests one synthetic corpus and replays the questions against it."""
+    with tempfile.TemporaryDirectory(prefix="eventbot-bench-") as workdir:
+        documents_dir = os.path.join(workdir, "documents")
+        chroma_path = os.path.join(workdir, "chroma")
+        os.makedirs(documents_dir)
+        build_corpus(documents_dir, num_docs, args.pages, args.lines, args.seed)
+        embedding_provider = get_embedding_provider("local", dimension=args.dim)
+
+        with contextlib.redirect_stdout(sys.stderr):
+            extract_stats = StageStats("PDF extraction", "pages")
+            split_stats = StageStats("Splitting", "chunks")
+            chunks = list(iter_document_chunks(
+                documents_dir, workers=args.workers, extract_stats=extract_stats, split_stats=split_stats
+            ))
+            extract_time = extract_stats.seconds
+            split_time = split_stats.seconds
+
+            start_time = time.perf_counter()
+            create_vector_database(
+                chunks, chroma_path, "offline", embedding_provider, batch_size=args.batch_size
+            )
+            ingest_time = time.perf_counter() - start_time
+
+            export_time = None
+            if args.vector_store == "mmap":
+                start_time = time.perf_counter()
+                export_vector_store(Chroma(persist_directory=chroma_path), chroma_path, DEFAULT_COLLECTION, args.mmap_dtype)
+                export_time = time.perf_counter() - start_time
+
+            bot = EventAssistantRAGBot(
+                "offline", chroma_path,
+                client=StubLLMClient(args.llm_latency),
+                embedding_provider=embedding_provider
+            )
+            bot.retriever.vector_store = args.vector_store
+            warmup = warm_up(chroma_path, "offline", embedding_provider=embedding_provider)
+            tracer.reset()
+            retrieval_times = []
+            end_to_end_times = []
+            cached_answers = 0
+            prompt_tokens = []
+            for question in questions:
+                start_time = time.perf_counter()
+                response = bot.answer_question(question)
+                end_to_end_times.append(time.perf_counter() - start_time)
+                retrieval_times.append(response["vector_db_time"])
+                cached_answers += bool(response.get("answer_cached"))
+                if response.get("tokens"):
+                    prompt_tokens.append(response["tokens"]["prompt"])
+
+    total_pages = num_docs * args.pages
+    return {
+        "documents": num_docs,
+        "pages": total_pages,
+        "chunks": len(chunks),
+        "extract_pages_per_sec": total_pages / extract_time if extract_time else None,
+        "split_chunks_per_sec": len(chunks) / split_time if split_time else None,
+        "ingest_chunks_per_sec": len(chunks) / ingest_time if ingest_time else None,
+        "ingest_seconds": ingest_time,
+        "vector_store": args.vector_store,
+        "export_seconds": export_time,
+        "open_seconds": bot.retriever.open_time,
+        "warmup_seconds": warmup["duration"],
+        "queries": len(questions),
+        "cached_answers": cached_answers,
+        "retrieval_seconds": percentiles(retrieval_times),
+        "end_to_end_seconds": percentiles(end_to_end_times),
+        # Estimated from the prompt length: the stub LLM reports no usage
+        "prompt_tokens": percentiles(prompt_tokens),
+        "stage_seconds": {
+            name: {key: summary[key] for key in ("count", "p50", "p95", "p99")}
+            for name, summary in tracer.snapshot().items()
+        },
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline ingestion and query latency benchmark.")
+    parser.add_argument("--sizes", default="10,50,200", help="Comma-separated corpus sizes (number of PDFs)")
+    parser.add_argument("--pages", type=int, default=3, help="Pages per synthetic PDF")
+    parser.add_argument("--lines", type=int, default=40, help="Lines per page")
+    parser.add_argument("--queries", type=int, default=100, help="Synthetic questions when --questions is not given")
+    parser.add_argument("--questions", help="JSONL file of questions to replay (e.g. requests.jsonl)")
+    parser.add_argument("--dim", type=int, default=256, help="Dimension of the local hashing embeddings")
+    parser.add_argument("--batch-size", type=int, default=100, help="Chunks per embedding batch")
+    parser.add_argument("--workers", type=int, default=1, help="Processes extracting PDF pages")
+    parser.add_argument("--vector-store", choices=["chroma", "mmap"], default="chroma",
+                        help="Query Chroma or the memory-mapped export")
+    parser.add_argument("--mmap-dtype", choices=DTYPES, default=VECTOR_STORE_DTYPE, help="Dtype of the export")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds the stub LLM takes per answer")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    if args.questions:
+        questions = load_questions(args.questions)
+    else:
+        rng = random.Random(args.seed)
+        questions = [synthetic_question(rng) for _ in range(args.queries)]
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "import_seconds": IMPORT_SECONDS,
+        "results": [],
+    }
+    for size in [int(size) for size in args.sizes.split(",") if size.strip()]:
+        print(f"Benchmarking {size} documents...", file=sys.stderr)
+        report["results"].append(run_size(size, questions, args))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
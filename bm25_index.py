@@ -0,0 +1,230 @@
+"""Local BM25 keyword index kept next to each Chroma collection.
+
+Event questions are often keyword-heavy (room numbers, speaker names,
+"5th floor", "1:00 PM") and pure vector search sometimes misses them. This
+index is rebuilt from the collection by populatedb.py and the upload path,
+saved as ready-to-search arrays (so opening a collection stays fast at any
+size), searched without any network call, and its ranking is fused with the
+vector ranking by reciprocal rank fusion.
+"""
+import json
+import os
+import re
+from array import array
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from langchain_core.documents import Document
+
+BM25_FILE = "bm25"
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60  # Standard reciprocal rank fusion constant
+
+# Times like "1:00" stay one token; everything else splits on non-word characters
+_TOKEN_RE = re.compile(r"\d{1,2}:\d{2}|\w+")
+STOPWORDS = frozenset("""
+a an and are at be by can do does for from has have how i in is it me my of on or please
+tell the there to was what when where which who why will with you your
+""".split())
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text.lower())
+
+
+def bm25_path(chroma_path, collection_name):
+    return os.path.join(chroma_path, f"{BM25_FILE}.{collection_name}.npz")
+
+
+def _legacy_bm25_path(chroma_path, collection_name):
+    # Raw texts only; loading meant re-tokenizing every chunk
+    return os.path.join(chroma_path, f"{BM25_FILE}.{collection_name}.json")
+
+
+def _pack(strings):
+    """Concatenated UTF-8 bytes and offsets; item i is data[offsets[i]:offsets[i + 1]]."""
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(data) for data in encoded])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _unpack_all(data, offsets):
+    return [data[offsets[i]:offsets[i + 1]].tobytes().decode("utf-8") for i in range(len(offsets) - 1)]
+
+
+class BM25Index:
+    """Inverted index with Okapi BM25 scoring, held in flat NumPy arrays.
+
+    The postings are stored CSR-style: the documents containing term t are
+    docs[offsets[t]:offsets[t + 1]], with their term frequencies in freqs.
+    Saved indexes load these arrays as they are, so opening a collection
+    never re-tokenizes its chunks; texts and metadata are decoded per hit.
+    """
+
+    def __init__(self, ids, terms, offsets, docs, freqs, doc_lengths, idf, avg_length,
+                 text_data, text_offsets, metadata_data, metadata_offsets):
+        self.ids = ids
+        self.term_rows = {term: row for row, term in enumerate(terms)}
+        self.terms = terms
+        self.offsets = offsets
+        self.docs = docs
+        self.freqs = freqs
+        self.doc_lengths = doc_lengths
+        self.idf = idf
+        self.avg_length = avg_length
+        self._text_data = text_data
+        self._text_offsets = text_offsets
+        self._metadata_data = metadata_data
+        self._metadata_offsets = metadata_offsets
+        # The length normalization of every document, computed once instead of per query
+        if len(doc_lengths):
+            self._norms = BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths / avg_length)
+        else:
+            self._norms = np.zeros(0)
+
+    @classmethod
+    def from_texts(cls, ids, texts, metadatas=None):
+        """Tokenizes the chunks and builds the index."""
+        texts = list(texts)
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        # Unseen terms get the next row number; lookups stay in C through map()
+        term_rows = defaultdict()
+        term_rows.default_factory = term_rows.__len__
+        # One (term, doc, frequency) row per distinct term of each document
+        term_column, doc_column, freq_column = array("i"), array("i"), array("i")
+        doc_lengths = np.zeros(len(texts), dtype=np.int32)
+        for doc_index, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths[doc_index] = len(tokens)
+            counts = Counter(tokens)
+            term_column.extend(map(term_rows.__getitem__, counts))
+            doc_column.extend([doc_index] * len(counts))
+            freq_column.extend(counts.values())
+        # Group the rows by term; the stable sort keeps each term's documents in order
+        term_column = np.frombuffer(term_column, dtype=np.int32)
+        order = np.argsort(term_column, kind="stable")
+        docs = np.frombuffer(doc_column, dtype=np.int32)[order]
+        freqs = np.minimum(np.frombuffer(freq_column, dtype=np.int32)[order], np.iinfo(np.uint16).max).astype(np.uint16)
+        offsets = np.zeros(len(term_rows) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(term_column, minlength=len(term_rows)))
+        terms = list(term_rows)
+        num_docs = len(texts)
+        document_frequency = np.diff(offsets)
+        idf = np.log(1 + (num_docs - document_frequency + 0.5) / (document_frequency + 0.5))
+        avg_length = float(doc_lengths.mean()) if num_docs else 0.0
+        text_data, text_offsets = _pack(texts)
+        metadata_data, metadata_offsets = _pack(json.dumps(metadata or {}) for metadata in metadatas)
+        return cls(list(ids), terms, offsets, docs, freqs, doc_lengths, idf, avg_length,
+                   text_data, text_offsets, metadata_data, metadata_offsets)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query, k=10):
+        """Returns up to k (doc index, score) pairs, best first."""
+        scores = np.zeros(len(self.ids))
+        for term in set(tokenize(query)):
+            row = self.term_rows.get(term)
+            if row is None:
+                continue
+            docs = self.docs[self.offsets[row]:self.offsets[row + 1]]
+            freqs = self.freqs[self.offsets[row]:self.offsets[row + 1]]
+            # A document appears once per term, so the fancy-indexed += is safe
+            scores[docs] += self.idf[row] * freqs * (BM25_K1 + 1) / (freqs + self._norms[docs])
+        # Every matching term adds a positive score
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        # Best first; ties in document order
+        matched = matched[np.lexsort((matched, -scores[matched]))]
+        return [(int(doc_index), float(scores[doc_index])) for doc_index in matched]
+
+    def is_confident(self, query, ranking, min_ratio=1.5):
+        """True when the top hit contains every content word of the query and clearly leads.
+
+        Used to skip the embedding call entirely for precise keyword questions.
+        """
+        if not ranking:
+            return False
+        terms = {term for term in tokenize(query) if term not in STOPWORDS}
+        if not terms:
+            return False
+        top_terms = set(tokenize(self.text(ranking[0][0])))
+        if not terms <= top_terms:
+            return False
+        return len(ranking) == 1 or ranking[0][1] >= min_ratio * ranking[1][1]
+
+    def text(self, doc_index):
+        return self._text_data[self._text_offsets[doc_index]:self._text_offsets[doc_index + 1]].tobytes().decode("utf-8")
+
+    def document(self, doc_index):
+        start, stop = self._metadata_offsets[doc_index], self._metadata_offsets[doc_index + 1]
+        return Document(
+            id=self.ids[doc_index],
+            page_content=self.text(doc_index),
+            metadata=json.loads(self._metadata_data[start:stop].tobytes()) or {}
+        )
+
+    def save(self, path):
+        ids, id_offsets = _pack(self.ids)
+        terms, term_offsets = _pack(self.terms)
+        with open(path + ".tmp", "wb") as file:
+            np.savez(
+                file,
+                ids=ids, id_offsets=id_offsets, terms=terms, term_offsets=term_offsets,
+                offsets=self.offsets, docs=self.docs, freqs=self.freqs,
+                doc_lengths=self.doc_lengths, idf=self.idf, avg_length=np.float64(self.avg_length),
+                text_data=self._text_data, text_offsets=self._text_offsets,
+                metadata_data=self._metadata_data, metadata_offsets=self._metadata_offsets,
+            )
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(
+                _unpack_all(data["ids"], data["id_offsets"]),
+                _unpack_all(data["terms"], data["term_offsets"]),
+                data["offsets"], data["docs"], data["freqs"], data["doc_lengths"], data["idf"],
+                float(data["avg_length"]),
+                data["text_data"], data["text_offsets"], data["metadata_data"], data["metadata_offsets"],
+            )
+
+
+def build_bm25_index(db, chroma_path, collection_name):
+    """Rebuilds the keyword index from everything currently in a Chroma collection."""
+    contents = db._collection.get(include=["documents", "metadatas"])
+    index = BM25Index.from_texts(contents["ids"], contents["documents"], contents["metadatas"])
+    index.save(bm25_path(chroma_path, collection_name))
+    print(f"Built BM25 index with {len(index)} chunks for collection {collection_name}.")
+    return index
+
+
+def load_bm25_index(chroma_path, collection_name):
+    """Returns the saved keyword index for a collection, or None if there isn't one."""
+    path = bm25_path(chroma_path, collection_name)
+    if os.path.exists(path):
+        return BM25Index.load(path)
+    legacy_path = _legacy_bm25_path(chroma_path, collection_name)
+    if not os.path.exists(legacy_path):
+        return None
+    # Written by an older version: convert it once, so later opens are fast
+    with open(legacy_path) as file:
+        data = json.load(file)
+    index = BM25Index.from_texts(data["ids"], data["texts"], data["metadatas"])
+    index.save(path)
+    os.remove(legacy_path)
+    print(f"Converted the BM25 index of collection {collection_name} to {path}.")
+    return index
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Fuses several rankings (lists of IDs, best first) into one list of (id, score)."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,133 @@
+"""Assembles the retrieved chunks into the context that goes into the prompt.
+
+Chunks are split with a large overlap, so the top results often repeat the
+same text. Before prompting we merge overlapping or adjacent chunks from the
+same source (using their start_index), order what is left by maximal
+marginal relevance so near-duplicates don't crowd out other sources, and
+pack it into CONTEXT_TOKEN_BUDGET tokens.
+"""
+import os
+
+from bm25_index import tokenize
+
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "5"))  # Chunks retrieved before packing
+# About three unique chunks: below what five merged candidates usually need, so the prompt shrinks
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))  # 1.0 = relevance only, 0.0 = diversity only
+CHARS_PER_TOKEN = 4  # Rough estimate, same as the prompt token estimate
+CONTEXT_SEPARATOR = "\n\n --- \n\n"
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN
+
+
+class Segment:
+    """A run of text made of one or more retrieved chunks."""
+
+    def __init__(self, doc, rank):
+        self.text = doc.page_content
+        self.source = doc.metadata.get("source")
+        self.start = doc.metadata.get("start_index")
+        self.end = self.start + len(self.text) if self.start is not None else None
+        self.chunk_ids = [doc.id or doc.page_content]
+        self.rank = rank  # Best rank among the merged chunks
+
+    def absorb(self, other):
+        """Appends `other` if it overlaps or directly follows this segment; returns whether it did."""
+        if other.start is None or self.end is None or other.start > self.end:
+            return False
+        overlap = self.end - other.start
+        if other.end <= self.end:
+            if other.text not in self.text:
+                return False
+        elif overlap == 0:
+            self.text += "\n" + other.text
+        elif self.text.endswith(other.text[:overlap]):
+            self.text += other.text[overlap:]
+        else:
+            # Offsets don't line up with the text (e.g. stripped whitespace); keep both
+            return False
+        self.end = max(self.end, other.end)
+        self.chunk_ids.extend(other.chunk_ids)
+        self.rank = min(self.rank, other.rank)
+        return True
+
+
+def merge_chunks(results):
+    """Turns ranked (doc, score) results into segments without repeated text."""
+    segments = []
+    seen = set()
+    for rank, (doc, _score) in enumerate(results):
+        if doc.page_content in seen:
+            continue
+        seen.add(doc.page_content)
+        segments.append(Segment(doc, rank))
+
+    # Only chunks that know where they came from can be merged
+    positioned = sorted(
+        (s for s in segments if s.source is not None and s.start is not None),
+        key=lambda s: (s.source, s.start)
+    )
+    merged = [s for s in segments if s.source is None or s.start is None]
+    for segment in positioned:
+        previous = merged[-1] if merged else None
+        if previous is not None and previous.source == segment.source and previous.absorb(segment):
+            continue
+        merged.append(segment)
+    return sorted(merged, key=lambda s: s.rank)
+
+
+def _similarity(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def mmr_order(segments, mmr_lambda=MMR_LAMBDA):
+    """Orders segments by maximal marginal relevance, using word overlap as similarity."""
+    if not segments:
+        return []
+    terms = [set(tokenize(segment.text)) for segment in segments]
+    relevance = [1.0 - index / len(segments) for index in range(len(segments))]  # Segments arrive best first
+    remaining = list(range(len(segments)))
+    selected = []
+    while remaining:
+        best = max(remaining, key=lambda i: mmr_lambda * relevance[i] - (1 - mmr_lambda) * max(
+            (_similarity(terms[i], terms[j]) for j in selected), default=0.0
+        ))
+        remaining.remove(best)
+        selected.append(best)
+    return [segments[index] for index in selected]
+
+
+def pack_context(results, token_budget=CONTEXT_TOKEN_BUDGET, mmr_lambda=MMR_LAMBDA):
+    """Builds the prompt context from ranked (doc, score) results.
+
+    Returns (context_text, chunk_ids, stats); chunk_ids covers every chunk
+    whose text made it into the context.
+    """
+    segments = mmr_order(merge_chunks(results), mmr_lambda)
+    budget_chars = token_budget * CHARS_PER_TOKEN
+    parts = []
+    chunk_ids = []
+    used = 0
+    for segment in segments:
+        text = segment.text
+        cost = len(text) + (len(CONTEXT_SEPARATOR) if parts else 0)
+        if used + cost > budget_chars:
+            if parts:
+                continue  # A smaller segment further down may still fit
+            text = text[:budget_chars]  # Always keep the start of the best segment
+            cost = len(text)
+        parts.append(text)
+        chunk_ids.extend(segment.chunk_ids)
+        used += cost
+    context_text = CONTEXT_SEPARATOR.join(parts)
+    return context_text, chunk_ids, {
+        "candidates": len(results),
+        "segments": len(segments),
+        "packed": len(parts),
+        "context_chars": len(context_text),
+        "context_tokens_est": estimate_tokens(context_text),
+    }
@@ -0,0 +1,161 @@
+"""Two-tier cache in front of the query embedding call.
+
+At an event most people ask the same handful of questions, so the query
+embedding is looked up in an in-memory LRU first, then in a small sqlite file
+on disk, and only then sent to the embedding API. Entries are keyed by the
+normalized question text and the embedding model name, so switching models
+never returns a stale vector.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(".cache", "embeddings.sqlite3"))
+EMBEDDING_CACHE_MEMORY_SIZE = int(os.getenv("EMBEDDING_CACHE_MEMORY_SIZE", "512"))
+EMBEDDING_CACHE_DISK_SIZE = int(os.getenv("EMBEDDING_CACHE_DISK_SIZE", "20000"))
+
+
+def normalize_query(text):
+    """Lowercases, collapses whitespace and drops trailing punctuation."""
+    text = re.sub(r"\s+", " ", text.strip().lower())
+    return text.rstrip("?!. ")
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an Embeddings object and caches embed_query results.
+
+    embed_documents is passed straight through: documents are embedded once at
+    index time and caching them would only fill the cache with one-off text.
+    """
+
+    def __init__(self, embeddings, model_name, cache_path=EMBEDDING_CACHE_PATH,
+                 max_memory_entries=EMBEDDING_CACHE_MEMORY_SIZE,
+                 max_disk_entries=EMBEDDING_CACHE_DISK_SIZE):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache_path = cache_path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._conn = None
+        if cache_path:
+            self._open_disk_cache()
+
+    def _open_disk_cache(self):
+        directory = os.path.dirname(self.cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # One connection shared by all script threads; every use holds self._lock
+        self._conn = sqlite3.connect(self.cache_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS query_embeddings ("
+            "key TEXT PRIMARY KEY, model TEXT, query TEXT, vector BLOB, last_used REAL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS query_embeddings_last_used ON query_embeddings (last_used)"
+        )
+        self._conn.commit()
+
+    def _key(self, normalized):
+        return hashlib.sha256(f"{self.model_name}\n{normalized}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key, vector):
+        """Puts a vector at the front of the LRU. Caller holds the lock."""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, key):
+        if self._conn is None:
+            return None
+        row = self._conn.execute(
+            "SELECT vector FROM query_embeddings WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        self._conn.execute(
+            "UPDATE query_embeddings SET last_used = ? WHERE key = ?", (time.time(), key)
+        )
+        self._conn.commit()
+        return array("f", row[0]).tolist()
+
+    def _write_disk(self, key, normalized, vector):
+        if self._conn is None:
+            return
+        self._conn.execute(
+            "INSERT OR REPLACE INTO query_embeddings (key, model, query, vector, last_used) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, self.model_name, normalized, array("f", vector).tobytes(), time.time()),
+        )
+        # Keep the file bounded by evicting the least recently used rows
+        count = self._conn.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0]
+        if count > self.max_disk_entries:
+            self._conn.execute(
+                "DELETE FROM query_embeddings WHERE key IN ("
+                "SELECT key FROM query_embeddings ORDER BY last_used ASC LIMIT ?)",
+                (count - self.max_disk_entries,),
+            )
+        self._conn.commit()
+
+    def lookup(self, text):
+        """Returns the cached vector for a query, or None; never calls the API."""
+        key = self._key(normalize_query(text))
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return list(vector)
+            vector = self._read_disk(key)
+            if vector is not None:
+                self._remember(key, vector)
+                self.disk_hits += 1
+                return list(vector)
+        return None
+
+    def embed_query(self, text):
+        vector = self.lookup(text)
+        if vector is not None:
+            return vector
+        with self._lock:
+            self.misses += 1
+
+        # Call the API outside the lock so other questions are not held up
+        normalized = normalize_query(text)
+        vector = self.embeddings.embed_query(text)
+        with self._lock:
+            key = self._key(normalized)
+            self._remember(key, vector)
+            self._write_disk(key, normalized, vector)
+        return list(vector)
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def stats(self):
+        """Hit/miss counters and current sizes of both tiers."""
+        with self._lock:
+            disk_size = 0
+            if self._conn is not None:
+                disk_size = self._conn.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0]
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else None,
+                "memory_size": len(self._memory),
+                "disk_size": disk_size,
+            }
@@ -0,0 +1,159 @@
+"""Embedding backends, selected with EMBEDDING_PROVIDER.
+
+- google: the Gemini embeddings API (default; what the committed index uses)
+- local: CPU-only hashed bag-of-words vectors computed in batches with NumPy.
+  No network round trip and no API quota, so indexing and retrieval can run
+  fully offline.
+
+Every index records the provider, model and dimension it was built with
+(collection metadata and the populatedb.py manifest). Opening an index with
+a different backend raises EmbeddingMismatchError instead of returning
+meaningless neighbours.
+"""
+import os
+import re
+import zlib
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "google")
+GOOGLE_EMBEDDING_MODEL = os.getenv("GOOGLE_EMBEDDING_MODEL", "models/embedding-001")
+GOOGLE_EMBEDDING_DIMENSIONS = {"models/embedding-001": 768, "models/text-embedding-004": 768}
+LOCAL_EMBEDDING_DIMENSION = int(os.getenv("LOCAL_EMBEDDING_DIMENSION", "512"))
+LOCAL_EMBEDDING_BATCH_SIZE = 256
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+class EmbeddingMismatchError(ValueError):
+    """An index was built with a different embedding backend than the configured one."""
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic local embeddings: signed hashed bag of words, L2-normalized.
+
+    Not semantically clever, but word overlap gives sensible similarity
+    scores and it costs no network calls.
+    """
+
+    def __init__(self, dim=LOCAL_EMBEDDING_DIMENSION, batch_size=LOCAL_EMBEDDING_BATCH_SIZE):
+        self.dim = dim
+        self.batch_size = batch_size
+        self._hashes = {}  # token -> crc32, vocabularies are small and repeat a lot
+
+    def _hash(self, token):
+        value = self._hashes.get(token)
+        if value is None:
+            value = self._hashes[token] = zlib.crc32(token.encode("utf-8"))
+        return value
+
+    def _embed_batch(self, texts):
+        token_lists = [_TOKEN_RE.findall(text.lower()) for text in texts]
+        lengths = np.fromiter((len(tokens) for tokens in token_lists), dtype=np.int64, count=len(texts))
+        hashes = np.fromiter(
+            (self._hash(token) for tokens in token_lists for token in tokens),
+            dtype=np.uint32, count=int(lengths.sum())
+        )
+        rows = np.repeat(np.arange(len(texts)), lengths)
+        columns = hashes % self.dim
+        signs = np.where(hashes & 0x80000000, 1.0, -1.0).astype(np.float32)
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        np.add.at(matrix, (rows, columns), signs)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def embed_documents(self, texts):
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(self._embed_batch(texts[start:start + self.batch_size]).tolist())
+        return vectors
+
+    def embed_query(self, text):
+        return self._embed_batch([text])[0].tolist()
+
+
+class EmbeddingProvider:
+    """Names one embedding backend and builds its client."""
+
+    name = None
+    cache_queries = False  # Worth keeping a query embedding cache in front of it
+    requires_api_key = False
+
+    def __init__(self, model, dimension):
+        self.model = model
+        self.dimension = dimension
+
+    @property
+    def key(self):
+        """Identifies vectors from this backend, e.g. for cache and registry keys."""
+        return f"{self.name}:{self.model}:{self.dimension}"
+
+    def metadata(self):
+        """What gets recorded in collection metadata and the index manifest."""
+        return {
+            "embedding_provider": self.name,
+            "embedding_model": self.model,
+            "embedding_dimension": self.dimension,
+        }
+
+    def create(self, api_key=None):
+        raise NotImplementedError
+
+    def check(self, metadata, dimension=None, where="index"):
+        """Raises EmbeddingMismatchError if recorded metadata names another backend.
+
+        Indexes built before this was recorded only carry some of the keys (or
+        none); whatever is there is compared, plus the stored vector dimension
+        if the caller knows it.
+        """
+        metadata = metadata or {}
+        expected = self.metadata()
+        recorded = {key: metadata[key] for key in expected if metadata.get(key) is not None}
+        if dimension is not None and self.dimension is not None:
+            recorded.setdefault("embedding_dimension", dimension)
+        mismatched = {key: value for key, value in recorded.items() if expected[key] not in (None, value)}
+        if mismatched:
+            raise EmbeddingMismatchError(
+                f"The {where} was built with {recorded}, but the configured embeddings are {expected}. "
+                "Rebuild it (python populatedb.py --rebuild) or change EMBEDDING_PROVIDER."
+            )
+
+
+class GoogleEmbeddingProvider(EmbeddingProvider):
+    name = "google"
+    cache_queries = True
+    requires_api_key = True
+
+    def __init__(self, model=GOOGLE_EMBEDDING_MODEL, dimension=None):
+        super().__init__(model, dimension or GOOGLE_EMBEDDING_DIMENSIONS.get(model))
+
+    def create(self, api_key=None):
+        # Imported here so the local backend works without the Google packages
+        from api_clients import GeminiEmbeddings
+        return GeminiEmbeddings(self.model, api_key)
+
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    name = "local"
+
+    def __init__(self, model="hashing", dimension=LOCAL_EMBEDDING_DIMENSION):
+        super().__init__(model, dimension)
+
+    def create(self, api_key=None):
+        return HashingEmbeddings(self.dimension)
+
+
+PROVIDERS = {
+    "google": GoogleEmbeddingProvider,
+    "local": LocalEmbeddingProvider,
+}
+
+
+def get_embedding_provider(name=None, **options):
+    """Returns the configured provider, or the named one with optional model/dimension."""
+    name = name or EMBEDDING_PROVIDER
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown EMBEDDING_PROVIDER {name!r}; choose one of {', '.join(PROVIDERS)}")
+    return PROVIDERS[name](**options)
@@ -0,0 +1,9 @@
+"""Loads the .env file into the environment.
+
+The project modules read their settings (GEMINI_BASE_URL, VECTOR_STORE,
+EMBEDDING_PROVIDER, ...) from the environment when they are imported, so
+entry points import this module before any of them.
+"""
+from dotenv import load_dotenv
+
+load_dotenv()
@@ -0,0 +1,120 @@
+"""Answers greetings and common FAQs without retrieval or an LLM call.
+
+Greetings are matched by one precompiled regex. FAQs are matched by their
+keywords: a question is only routed to an FAQ when every content word in it
+belongs to that FAQ, so "where is lunch?" is answered from the table but
+"is lunch vegetarian?" still goes through the full RAG path.
+
+FAQ answers are generated once per index by populatedb.py (with the normal
+RAG pipeline) and saved as faq.<collection>.json next to the Chroma data.
+"""
+import json
+import os
+import re
+
+from bm25_index import STOPWORDS, tokenize
+
+FAQ_FILE = "faq"
+
+_GREETING_RE = re.compile(r"""
+    ^\s*(?:
+        (?P<how_are_you>(?:(?:hi+|hello+|hey+)[\s,!]*)?how\s+(?:are|r)\s+(?:you|u)(?:\s+doing)?(?:\s+today)?)
+      | (?P<greeting>(?:hi+|hello+|hey+|namaste|namaskar|good\s+(?:morning|afternoon|evening))
+                     (?:\s+(?:there|all|everyone|event\s*bot|bot))?)
+      | (?P<thanks>(?:thanks|thank\s+you|thx|dhanyavaad|dhanyawad|shukriya)
+                   (?:\s+(?:a\s+lot|so\s+much|very\s+much))?)
+      | (?P<goodbye>bye|goodbye|see\s+you|alvida)
+    )[\s!.?,]*$
+""", re.IGNORECASE | re.VERBOSE)
+
+GREETING_ANSWERS = {
+    "event": {
+        "greeting": "Hello! I'm Event Bot. Ask me anything about the event, like the schedule, venue, registration or lunch.",
+        "how_are_you": "I'm doing great, thanks for asking! How can I help you with the event today?",
+        "thanks": "You're welcome! Let me know if you have any other questions about the event.",
+        "goodbye": "Goodbye! Enjoy the event.",
+    },
+    "resume": {
+        "greeting": "Hello! I'm Resume Assistant. Ask me anything about the uploaded resume.",
+        "how_are_you": "I'm doing well, thanks! What would you like to know about the resume?",
+        "thanks": "You're welcome! Let me know if you have any other questions about the resume.",
+        "goodbye": "Goodbye!",
+    },
+}
+
+# The question populatedb.py asks for each FAQ, and the words that identify it
+FAQ_INTENTS = {
+    "lunch": {
+        "question": "Where and when will lunch be served?",
+        "keywords": {"lunch", "food", "eat", "meal", "meals", "khana", "served", "serve", "provided"},
+    },
+    "registration": {
+        "question": "How and when do I register or check in at the event?",
+        "keywords": {"registration", "register", "check", "checkin", "desk", "reporting"},
+    },
+    "venue": {
+        "question": "Where is the event venue?",
+        "keywords": {"venue", "address", "location", "located", "reach", "held"},
+    },
+    "schedule": {
+        "question": "What is the schedule of the event?",
+        "keywords": {"schedule", "agenda", "timeline", "sessions", "start", "starts", "end", "ends"},
+    },
+    "wifi": {
+        "question": "What are the Wi-Fi details at the venue?",
+        "keywords": {"wifi", "wi", "fi", "internet", "password", "network"},
+    },
+}
+# Words that don't change which FAQ a question is about
+FAQ_FILLER_WORDS = STOPWORDS | {"event", "the", "time", "timing", "timings", "today", "kab", "kahan", "hai", "ka", "ki", "ke"}
+
+_FAQ_BY_KEYWORD = {}
+for _intent, _faq in FAQ_INTENTS.items():
+    for _keyword in _faq["keywords"]:
+        _FAQ_BY_KEYWORD.setdefault(_keyword, set()).add(_intent)
+
+
+def match_greeting(query):
+    """Returns the greeting intent name for a pure greeting, or None."""
+    match = _GREETING_RE.match(query)
+    return match.lastgroup if match else None
+
+
+def match_faq(query):
+    """Returns the FAQ intent whose keywords cover every content word of the query, or None."""
+    words = {word for word in tokenize(query) if word not in FAQ_FILLER_WORDS}
+    if not words:
+        return None
+    candidates = None
+    for word in words:
+        intents = _FAQ_BY_KEYWORD.get(word)
+        if not intents:
+            return None
+        candidates = intents if candidates is None else candidates & intents
+    if candidates and len(candidates) == 1:
+        return next(iter(candidates))
+    return None
+
+
+def greeting_answer(intent, template_type="event"):
+    return GREETING_ANSWERS.get(template_type, GREETING_ANSWERS["event"])[intent]
+
+
+def faq_path(chroma_path, collection_name):
+    return os.path.join(chroma_path, f"{FAQ_FILE}.{collection_name}.json")
+
+
+def load_faq_answers(chroma_path, collection_name):
+    """Returns {intent: answer} saved for a collection, or None if there is no table."""
+    try:
+        with open(faq_path(chroma_path, collection_name)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def save_faq_answers(chroma_path, collection_name, answers):
+    path = faq_path(chroma_path, collection_name)
+    with open(path + ".tmp", "w") as file:
+        json.dump(answers, file, indent=2)
+    os.replace(path + ".tmp", path)
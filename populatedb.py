@@ -1,78 +1,348 @@
 import os
-import PyPDF2
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+import argparse
+import bisect
+import hashlib
+import itertools
+import json
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
-from dotenv import load_dotenv
 import shutil
-
-# Load environment variables
-load_dotenv()
+import environment
+from bm25_index import bm25_path, build_bm25_index
+from embedding_providers import EMBEDDING_PROVIDER, PROVIDERS, EmbeddingMismatchError, get_embedding_provider
+from intent_router import FAQ_INTENTS, faq_path, save_faq_answers
+from retriever import DEFAULT_COLLECTION, bump_collection_version
+from vector_store import DTYPES, VECTOR_STORE, VECTOR_STORE_DTYPE, export_vector_store, open_vector_store, remove_vector_store
 
 # --- Configuration ---
 DOCUMENTS_DIR = "documents"
 CHROMA_PERSIST_DIR = "chroma"
-EMBEDDING_MODEL = "models/embedding-001"
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+PDF_WORKERS = os.cpu_count() or 1
+PAGES_PER_TASK = 25          # Large PDFs are split into page ranges across workers
+CHUNK_SIZE = 2000
+CHUNK_OVERLAP = 800
+SPLIT_WINDOW_CHARS = 20 * CHUNK_SIZE  # Text buffered per document before splitting
+EMBEDDING_BATCH_SIZE = 100   # Texts per embed_documents call
+EMBEDDING_CONCURRENCY = 4    # Embedding batches in flight at once
+MANIFEST_FILE = "index_manifest.json"  # File and chunk hashes of what is in the index
 
-# --- Validation ---
-if not GEMINI_API_KEY:
-    print("Error: GEMINI_API_KEY not found in .env file.")
-    exit()
+# --- Functions ---
+class StageStats:
+    """Counts items and wall time for one pipeline stage."""
 
-if not os.path.exists(DOCUMENTS_DIR):
-    print(f"Error: Documents directory '{DOCUMENTS_DIR}' not found.")
-    print("Please create a folder named 'documents' and place your PDF files inside.")
-    exit()
+    def __init__(self, name, unit):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.seconds = 0.0
 
-# --- Functions ---
-def extract_text_from_pdf(pdf_path):
-    """Extracts text from a single PDF file."""
+    def add(self, items, seconds):
+        self.items += items
+        self.seconds += seconds
+
+    def report(self):
+        rate = self.items / self.seconds if self.seconds else 0.0
+        return f"{self.name}: {self.items} {self.unit} in {self.seconds:.2f}s ({rate:.1f} {self.unit}/s)"
+
+
+def count_pdf_pages(pdf_path):
+    """Returns the number of pages in a PDF, or None if it cannot be read."""
+    # PyPDF2 and the text splitter are imported where they are used, so
+    # importing this module (e.g. from uploads.py in the app) stays cheap
+    import PyPDF2
     try:
         with open(pdf_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page_num in range(len(reader.pages)):
-                text += reader.pages[page_num].extract_text() or "" # Add empty string if page is empty
-            return text
+            return len(PyPDF2.PdfReader(file).pages)
     except Exception as e:
         print(f"Error reading PDF {pdf_path}: {e}")
         return None
 
-def process_documents(documents_dir):
-    """Reads all PDFs in the directory and extracts text."""
-    all_texts = []
-    print(f"Scanning directory: {documents_dir}")
-    for filename in os.listdir(documents_dir):
-        if filename.endswith(".pdf"):
-            pdf_path = os.path.join(documents_dir, filename)
-            print(f"Processing {filename}...")
-            text = extract_text_from_pdf(pdf_path)
-            if text:
-                # Store as Langchain Document objects, including source metadata
-                all_texts.append(Document(page_content=text, metadata={"source": filename}))
-                print(f"Extracted text from {filename}")
-            else:
-                print(f"Could not extract text from {filename}")
-    return all_texts
-
-def split_text_into_chunks(documents):
-    """Splits list of documents into smaller chunks."""
-    # You can adjust chunk_size and chunk_overlap as needed
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=2000, chunk_overlap=800)
-    print(f"Splitting documents into chunks...")
-    chunks = text_splitter.split_documents(documents)
-    print(f"Created {len(chunks)} chunks.")
-    return chunks
-
-def create_vector_database(chunks, persist_directory, api_key, embedding_model):
-    """Creates or updates a Chroma vector database from text chunks."""
-    print(f"Initializing Google Generative AI Embeddings using model: {embedding_model}")
-    embedding_function = GoogleGenerativeAIEmbeddings(
-        model=embedding_model,
-        google_api_key=api_key
+def extract_page_range(pdf_path, start_page, end_page):
+    """Extracts pages [start_page, end_page) of a PDF. Runs in a worker process."""
+    import PyPDF2
+    with open(pdf_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        return [reader.pages[page_num].extract_text() or "" for page_num in range(start_page, end_page)]
+
+def _page_ranges(pdf_paths, pages_per_task):
+    for pdf_path in pdf_paths:
+        num_pages = count_pdf_pages(pdf_path)
+        if not num_pages:
+            print(f"Could not extract text from {os.path.basename(pdf_path)}")
+            continue
+        for start_page in range(0, num_pages, pages_per_task):
+            yield pdf_path, start_page, min(start_page + pages_per_task, num_pages)
+
+def iter_pdf_pages(pdf_paths, workers=PDF_WORKERS, pages_per_task=PAGES_PER_TASK):
+    """Yields (pdf_path, page_number, text) for every page of the PDFs, in order.
+
+    With more than one worker, page ranges (of every file, so many small PDFs
+    parallelize too) are extracted in a process pool at most 2 * workers
+    ranges ahead of the consumer. Either way only a bounded number of pages is
+    held in memory, however large the PDFs are. Page numbers start at 1.
+    """
+    if workers <= 1:
+        import PyPDF2
+        for pdf_path in pdf_paths:
+            try:
+                with open(pdf_path, 'rb') as file:
+                    reader = PyPDF2.PdfReader(file)
+                    for page_num, page in enumerate(reader.pages):
+                        yield pdf_path, page_num + 1, page.extract_text() or ""
+            except Exception as e:
+                print(f"Error reading PDF {os.path.basename(pdf_path)}: {e}")
+        return
+
+    def finished(task, future):
+        pdf_path, start_page, _end_page = task
+        try:
+            texts = future.result()
+        except Exception as e:
+            print(f"Error reading PDF {os.path.basename(pdf_path)} (from page {start_page + 1}): {e}")
+            return
+        for offset, text in enumerate(texts):
+            yield pdf_path, start_page + offset + 1, text
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        window = deque()
+        for task in _page_ranges(pdf_paths, pages_per_task):
+            window.append((task, executor.submit(extract_page_range, *task)))
+            if len(window) >= 2 * workers:
+                yield from finished(*window.popleft())
+        while window:
+            yield from finished(*window.popleft())
+
+def list_pdf_files(documents_dir):
+    """Returns the sorted PDF file names in a directory."""
+    return sorted(filename for filename in os.listdir(documents_dir) if filename.endswith(".pdf"))
+
+def file_sha256(path):
+    """Hashes a file's bytes so unchanged files can be skipped without parsing them."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _text_splitter():
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    # start_index is kept in metadata so chunk IDs stay stable between runs
+    return RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, add_start_index=True)
+
+def split_pages(pages, metadata):
+    """Splits one document, given as (page_number, text) pairs, into chunks as the pages arrive.
+
+    Pages are joined with line breaks and split in windows of about
+    SPLIT_WINDOW_CHARS, so memory stays bounded however long the document is.
+    start_index is the offset in the whole document; page and page_end are the
+    pages a chunk starts and ends on (left out when page_number is None).
+
+    The chunks are close to, but not always the same as, one split of the
+    whole text: the splitter picks its separators from the text it is given,
+    so next to a window boundary a chunk can end a few characters earlier
+    or later. The result is deterministic for a given file, and every index
+    path splits this way, so chunk IDs are stable between runs; an index
+    built before this change needs `--rebuild` once.
+    """
+    splitter = _text_splitter()
+    buffer = ""
+    buffer_start = 0       # Document offset of buffer[0]
+    page_offsets = []      # Document offsets where the pages in the buffer start
+    page_numbers = []
+    length = 0             # Document length so far
+
+    def chunks_from_buffer(final):
+        nonlocal buffer, buffer_start
+        docs = splitter.create_documents([buffer])
+        if final:
+            ready = docs
+        else:
+            # The last chunks may continue into pages not read yet; they are split again next time
+            safe_end = len(buffer) - CHUNK_SIZE
+            ready = [d for d in docs[:-1] if d.metadata["start_index"] + len(d.page_content) <= safe_end]
+        for doc in ready:
+            start = buffer_start + doc.metadata["start_index"]
+            end = start + len(doc.page_content)
+            chunk_metadata = dict(metadata, start_index=start)
+            first_page = page_numbers[bisect.bisect_right(page_offsets, start) - 1] if page_offsets else None
+            if first_page is not None:
+                chunk_metadata["page"] = first_page
+                chunk_metadata["page_end"] = page_numbers[bisect.bisect_right(page_offsets, end - 1) - 1]
+            yield Document(page_content=doc.page_content, metadata=chunk_metadata)
+        if not final and ready:
+            keep_from = docs[len(ready)].metadata["start_index"]
+            buffer = buffer[keep_from:]
+            buffer_start += keep_from
+            # Forget pages that ended before the buffer, keeping the one it starts in
+            first = max(bisect.bisect_right(page_offsets, buffer_start) - 1, 0)
+            del page_offsets[:first]
+            del page_numbers[:first]
+
+    for page_number, text in pages:
+        if length:
+            buffer += "\n"
+            length += 1
+        if page_number is not None:
+            page_offsets.append(length)
+            page_numbers.append(page_number)
+        buffer += text
+        length += len(text)
+        if len(buffer) >= SPLIT_WINDOW_CHARS:
+            yield from chunks_from_buffer(final=False)
+    if buffer.strip():
+        yield from chunks_from_buffer(final=True)
+
+def _timed(items, stats, exclude=None):
+    """Passes items through, adding the time spent producing each one to stats.
+
+    Time that `exclude` (an inner _timed stage) accounted for is not counted twice.
+    """
+    iterator = iter(items)
+    while True:
+        start_time = time.time()
+        excluded = exclude.seconds if exclude is not None else 0.0
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        inner = (exclude.seconds - excluded) if exclude is not None else 0.0
+        stats.add(1, time.time() - start_time - inner)
+        yield item
+
+def iter_document_chunks(documents_dir, filenames=None, workers=PDF_WORKERS, pages_per_task=PAGES_PER_TASK,
+                         extract_stats=None, split_stats=None):
+    """Streams the chunks of all PDFs in the directory (or only `filenames`), page by page."""
+    extract_stats = extract_stats or StageStats("PDF extraction", "pages")
+    split_stats = split_stats or StageStats("Splitting", "chunks")
+    filenames = filenames if filenames is not None else list_pdf_files(documents_dir)
+    print(f"Extracting {len(filenames)} PDFs from {documents_dir} with {workers} workers...")
+    pages = _timed(
+        iter_pdf_pages([os.path.join(documents_dir, f) for f in filenames], workers, pages_per_task),
+        extract_stats
     )
+    # Consecutive pages of the same file form one document
+    for pdf_path, file_pages in itertools.groupby(pages, key=lambda page: page[0]):
+        filename = os.path.basename(pdf_path)
+        chunks = split_pages(
+            ((page_number, text) for _path, page_number, text in file_pages), {"source": filename}
+        )
+        num_chunks = 0
+        for chunk in _timed(chunks, split_stats, exclude=extract_stats):
+            num_chunks += 1
+            yield chunk
+        if num_chunks:
+            print(f"Extracted {num_chunks} chunks from {filename}")
+        else:
+            print(f"Could not extract text from {filename}")
+
+def embed_in_batches(chunks, embedding_function, batch_size=EMBEDDING_BATCH_SIZE,
+                     concurrency=EMBEDDING_CONCURRENCY):
+    """Yields (batch, embeddings) as batches finish, with at most `concurrency` in flight.
+
+    `chunks` may be a generator; it is only read as far as the window needs.
+    Gemini calls are retried with backoff by the pooled client (api_clients.py).
+    """
+    chunks = iter(chunks)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = {}
+        batch = list(itertools.islice(chunks, batch_size))
+        while batch or pending:
+            # Keep the window full without reading every chunk up front
+            while batch and len(pending) < concurrency:
+                texts = [chunk.page_content for chunk in batch]
+                pending[executor.submit(embedding_function.embed_documents, texts)] = batch
+                batch = list(itertools.islice(chunks, batch_size))
+            future = next(as_completed(pending))
+            done_batch = pending.pop(future)
+            yield done_batch, future.result()
+
+def chunk_id(chunk):
+    """Stable ID from source, offset and content, so re-runs upsert instead of duplicating."""
+    content_hash = hashlib.sha256(chunk.page_content.encode("utf-8")).hexdigest()
+    key = f"{chunk.metadata.get('source')}:{chunk.metadata.get('start_index')}:{content_hash}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+def load_manifest(persist_directory):
+    """Returns the index manifest, or None if the index was not built incrementally."""
+    try:
+        with open(os.path.join(persist_directory, MANIFEST_FILE)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+def save_manifest(persist_directory, manifest):
+    path = os.path.join(persist_directory, MANIFEST_FILE)
+    with open(path + ".tmp", "w") as file:
+        json.dump(manifest, file)
+    os.replace(path + ".tmp", path)
+
+def add_manifest_entry(files, chunk, file_hashes):
+    source = chunk.metadata.get("source")
+    entry = files.setdefault(source, {"hash": file_hashes.get(source), "chunks": {}})
+    entry["chunks"][str(chunk.metadata.get("start_index"))] = chunk_id(chunk)
+
+def store_chunks(db, chunks, embedding_function, batch_size=EMBEDDING_BATCH_SIZE,
+                 concurrency=EMBEDDING_CONCURRENCY, embed_stats=None, insert_stats=None,
+                 on_progress=None):
+    """Embeds chunks in batches and upserts each batch as soon as it is ready.
+
+    `chunks` may be a list or a generator (then it is consumed as embedding
+    goes). on_progress, if given, is called with (stored, total) after every
+    batch; total is None for generators. Returns the number of chunks stored.
+    """
+    embed_stats = embed_stats or StageStats("Embedding", "chunks")
+    insert_stats = insert_stats or StageStats("Chroma insert", "chunks")
+    total = len(chunks) if hasattr(chunks, "__len__") else None
+    if total == 0:
+        return 0
+
+    # Batches are inserted as soon as they are embedded, so the two stages overlap
+    print(f"Embedding {total or 'all'} chunks in batches of {batch_size} ({concurrency} concurrent)...")
+    inserted = 0
+    insert_seconds = 0.0
+    # Time spent producing the chunks (e.g. extracting PDFs) isn't embedding time
+    source_stats = StageStats("Reading", "chunks")
+    embed_start = time.time()
+    batches = embed_in_batches(_timed(chunks, source_stats), embedding_function, batch_size, concurrency)
+    for batch, embeddings in batches:
+        insert_start = time.time()
+        db._collection.upsert(
+            ids=[chunk_id(chunk) for chunk in batch],
+            embeddings=embeddings,
+            documents=[chunk.page_content for chunk in batch],
+            metadatas=[chunk.metadata for chunk in batch],
+        )
+        insert_seconds += time.time() - insert_start
+        inserted += len(batch)
+        print(f"  {inserted}/{total} chunks stored" if total else f"  {inserted} chunks stored")
+        if on_progress is not None:
+            on_progress(inserted, total)
+    insert_stats.add(inserted, insert_seconds)
+    embed_stats.add(inserted, time.time() - embed_start - insert_seconds - source_stats.seconds)
+    return inserted
+
+def create_vector_database(chunks, persist_directory, api_key, embedding_provider=None,
+                           batch_size=EMBEDDING_BATCH_SIZE, concurrency=EMBEDDING_CONCURRENCY,
+                           embed_stats=None, insert_stats=None, file_hashes=None):
+    """Creates a Chroma vector database from text chunks, replacing any existing one.
+
+    `chunks` may be a generator, e.g. from iter_document_chunks, so documents
+    are extracted, embedded and stored as a stream. Returns the number of
+    chunks stored; with no chunks at all the existing database is kept.
+    """
+    chunks = iter(chunks)
+    first_chunk = next(chunks, None)
+    if first_chunk is None:
+        print("No text chunks to index; keeping the existing database.")
+        return 0
+    chunks = itertools.chain([first_chunk], chunks)
+    embedding_provider = embedding_provider or get_embedding_provider()
+    print(f"Initializing {embedding_provider.name} embeddings using model: {embedding_provider.model}")
+    embedding_function = embedding_provider.create(api_key)
 
     # Option: Clear existing database before creating a new one
     if os.path.exists(persist_directory):
@@ -81,38 +351,261 @@ def create_vector_database(chunks, persist_directory, api_key, embedding_model):
         print("Existing database removed.")
 
     print(f"Creating new Chroma database at {persist_directory}...")
-    db = Chroma.from_documents(
-        chunks,
-        embedding_function,
-        persist_directory=persist_directory
+    # The app refuses to query the collection with a different embedding backend
+    db = Chroma(
+        persist_directory=persist_directory,
+        embedding_function=embedding_function,
+        collection_metadata=embedding_provider.metadata()
+    )
+    # Chunk IDs are recorded for the manifest as the chunks stream past
+    files = {}
+
+    def recorded(chunks):
+        for chunk in chunks:
+            add_manifest_entry(files, chunk, file_hashes or {})
+            yield chunk
+
+    num_chunks = store_chunks(
+        db, recorded(chunks), embedding_function, batch_size, concurrency, embed_stats, insert_stats
     )
-    db.persist() # Ensure data is written to disk
-    print(f"Chroma database created successfully with {len(chunks)} chunks.")
+
+    # With file hashes the next run can be incremental
+    if file_hashes is not None:
+        save_manifest(persist_directory, {**embedding_provider.metadata(), "files": files})
+    build_bm25_index(db, persist_directory, DEFAULT_COLLECTION)
+
+    # Running app servers drop their open store and cached answers on the next question
+    bump_collection_version(persist_directory)
+    print(f"Chroma database created successfully with {num_chunks} chunks.")
     print(f"Database stored in: {os.path.abspath(persist_directory)}")
+    return num_chunks
+
+def update_vector_database(documents_dir, persist_directory, api_key, embedding_provider=None,
+                           workers=PDF_WORKERS, batch_size=EMBEDDING_BATCH_SIZE,
+                           concurrency=EMBEDDING_CONCURRENCY, extract_stats=None,
+                           embed_stats=None, insert_stats=None, split_stats=None):
+    """Re-indexes only new, changed and removed PDFs using the manifest.
+
+    Returns the added/updated/deleted/skipped counts, or None when the
+    existing index can't be updated in place and needs a full rebuild.
+    """
+    embedding_provider = embedding_provider or get_embedding_provider()
+    manifest = load_manifest(persist_directory)
+    if manifest is None:
+        print("No usable index manifest found; a full rebuild is needed.")
+        return None
+    try:
+        embedding_provider.check(manifest, where="index")
+    except EmbeddingMismatchError as e:
+        print(f"{e}\nA full rebuild is needed.")
+        return None
+
+    embedding_function = embedding_provider.create(api_key)
+    db = Chroma(persist_directory=persist_directory, embedding_function=embedding_function)
+    indexed_files = manifest["files"]
+    # The upload path or a crashed run may have touched the collection behind our back
+    expected = sum(len(entry["chunks"]) for entry in indexed_files.values())
+    if db._collection.count() != expected:
+        print(f"Index has {db._collection.count()} chunks but the manifest lists {expected}; a full rebuild is needed.")
+        return None
+
+    file_hashes = {
+        filename: file_sha256(os.path.join(documents_dir, filename))
+        for filename in list_pdf_files(documents_dir)
+    }
+    changed = [f for f in file_hashes if indexed_files.get(f, {}).get("hash") != file_hashes[f]]
+    removed = [f for f in indexed_files if f not in file_hashes]
+    counts = {"added": 0, "updated": 0, "deleted": 0, "skipped": 0}
+    for filename in file_hashes:
+        if filename not in changed:
+            counts["skipped"] += len(indexed_files[filename]["chunks"])
+
+    new_entries = {}  # Only the chunk IDs of the changed files, never their texts
+    to_delete = []
+
+    def changed_chunks():
+        """Yields the chunks of the changed files that aren't stored yet, as they are split."""
+        chunks = iter_document_chunks(
+            documents_dir, changed, workers, extract_stats=extract_stats, split_stats=split_stats
+        )
+        for chunk in chunks:
+            source = chunk.metadata.get("source")
+            offset = str(chunk.metadata.get("start_index"))
+            add_manifest_entry(new_entries, chunk, file_hashes)
+            old_id = indexed_files.get(source, {}).get("chunks", {}).get(offset)
+            if old_id == new_entries[source]["chunks"][offset]:
+                counts["skipped"] += 1
+                continue
+            counts["updated" if old_id else "added"] += 1
+            if old_id:
+                to_delete.append(old_id)
+            yield chunk
+
+    if changed:
+        print(f"{len(changed)} new or changed PDFs to re-index.")
+        # Stored as they are split, so a large changed PDF is never held in memory at once.
+        # New chunks get new IDs, so the old ones can still be deleted afterwards.
+        stored = store_chunks(db, changed_chunks(), embedding_function, batch_size, concurrency,
+                              embed_stats, insert_stats)
+        for filename in changed:
+            old_chunks = indexed_files.get(filename, {}).get("chunks", {})
+            new_chunks = new_entries.get(filename, {}).get("chunks", {})
+            for offset, old_id in old_chunks.items():
+                if offset not in new_chunks:
+                    counts["deleted"] += 1
+                    to_delete.append(old_id)
+            if filename in new_entries:
+                indexed_files[filename] = new_entries[filename]
+            else:
+                # Nothing could be extracted; treat it like a removed file
+                indexed_files.pop(filename, None)
+    else:
+        stored = 0
+
+    for filename in removed:
+        old_chunks = indexed_files.pop(filename)["chunks"]
+        counts["deleted"] += len(old_chunks)
+        to_delete.extend(old_chunks.values())
+
+    if to_delete:
+        print(f"Deleting {len(to_delete)} stale chunks...")
+        db._collection.delete(ids=to_delete)
+
+    if stored or to_delete:
+        save_manifest(persist_directory, manifest)
+        # A memory-mapped export of the old chunks must not be served; main re-exports if asked to
+        if remove_vector_store(persist_directory, DEFAULT_COLLECTION):
+            print("Removed the outdated memory-mapped export.")
+    # Also builds the keyword index for databases created before it existed
+    if stored or to_delete or not os.path.exists(bm25_path(persist_directory, DEFAULT_COLLECTION)):
+        build_bm25_index(db, persist_directory, DEFAULT_COLLECTION)
+        bump_collection_version(persist_directory)
+    print(
+        f"Incremental update finished: {counts['added']} added, {counts['updated']} updated, "
+        f"{counts['deleted']} deleted, {counts['skipped']} skipped."
+    )
+    return counts
+
+def build_faq_answers(persist_directory, api_key, embedding_provider=None, collection_name=DEFAULT_COLLECTION):
+    """Answers every FAQ once with the full RAG pipeline and saves the table the intent router uses."""
+    # Pulls in the Gemini client and LangChain's prompts, which nothing else here needs
+    from rag_bot import EventAssistantRAGBot
+
+    # The old table must not answer the questions being regenerated
+    if os.path.exists(faq_path(persist_directory, collection_name)):
+        os.remove(faq_path(persist_directory, collection_name))
+    bot = EventAssistantRAGBot(
+        api_key, persist_directory, collection_name=collection_name, embedding_provider=embedding_provider
+    )
+    answers = {}
+    for intent, faq in FAQ_INTENTS.items():
+        response = bot.answer_question(faq["question"])
+        if "error" in response["trace"]["attributes"]:
+            print(f"  Skipping FAQ '{intent}': {response['text']}")
+            continue
+        answers[intent] = response["text"]
+    save_faq_answers(persist_directory, collection_name, answers)
+    # Running app servers pick up the new table with the reopened store
+    bump_collection_version(persist_directory, collection_name)
+    print(f"Precomputed answers for {len(answers)} of {len(FAQ_INTENTS)} FAQs.")
 
 # --- Main Execution ---
 if __name__ == "__main__":
-    # 1. Process PDF documents
-    documents = process_documents(DOCUMENTS_DIR)
+    parser = argparse.ArgumentParser(description="Build the Chroma vector database from the PDFs in documents/.")
+    parser.add_argument("--workers", type=int, default=PDF_WORKERS, help="Processes used for PDF extraction")
+    parser.add_argument("--batch-size", type=int, default=EMBEDDING_BATCH_SIZE, help="Chunks per embedding request")
+    parser.add_argument("--concurrency", type=int, default=EMBEDDING_CONCURRENCY, help="Embedding requests in flight")
+    parser.add_argument("--rebuild", action="store_true", help="Delete the index and re-embed every chunk")
+    parser.add_argument("--embedding-provider", choices=sorted(PROVIDERS), default=EMBEDDING_PROVIDER,
+                        help="Embedding backend; the app must use the same one (EMBEDDING_PROVIDER)")
+    parser.add_argument("--skip-faq", action="store_true", help="Don't precompute the FAQ answers (needs Gemini)")
+    parser.add_argument("--export-mmap", action="store_true", default=VECTOR_STORE == "mmap",
+                        help="Also export the index to the memory-mapped store (default with VECTOR_STORE=mmap)")
+    parser.add_argument("--mmap-dtype", choices=DTYPES, default=VECTOR_STORE_DTYPE,
+                        help="How the exported vectors are stored")
+    args = parser.parse_args()
+    embedding_provider = get_embedding_provider(args.embedding_provider)
 
-    if not documents:
-        print("No text extracted from any PDF files. Exiting.")
+    # --- Validation ---
+    if embedding_provider.requires_api_key and not GEMINI_API_KEY:
+        print("Error: GEMINI_API_KEY not found in .env file.")
         exit()
 
-    # 2. Split text into chunks
-    text_chunks = split_text_into_chunks(documents)
-
-    if not text_chunks:
-        print("No text chunks created after splitting. Exiting.")
+    if not os.path.exists(DOCUMENTS_DIR):
+        print(f"Error: Documents directory '{DOCUMENTS_DIR}' not found.")
+        print("Please create a folder named 'documents' and place your PDF files inside.")
         exit()
 
-    # 3. Create/Update the vector database
-    create_vector_database(
-        text_chunks,
-        CHROMA_PERSIST_DIR,
-        GEMINI_API_KEY,
-        EMBEDDING_MODEL
-    )
+    extract_stats = StageStats("PDF extraction", "pages")
+    split_stats = StageStats("Splitting", "chunks")
+    embed_stats = StageStats("Embedding", "chunks")
+    insert_stats = StageStats("Chroma insert", "chunks")
+
+    counts = None
+    if not args.rebuild and os.path.exists(CHROMA_PERSIST_DIR):
+        # Only new, changed or removed PDFs are touched
+        counts = update_vector_database(
+            DOCUMENTS_DIR,
+            CHROMA_PERSIST_DIR,
+            GEMINI_API_KEY,
+            embedding_provider,
+            workers=args.workers,
+            batch_size=args.batch_size,
+            concurrency=args.concurrency,
+            extract_stats=extract_stats,
+            embed_stats=embed_stats,
+            insert_stats=insert_stats,
+            split_stats=split_stats
+        )
+
+    if counts is None:
+        # 1. Stream pages out of the PDFs, 2. split them into chunks,
+        # 3. embed and store the chunks as they come
+        file_hashes = {
+            filename: file_sha256(os.path.join(DOCUMENTS_DIR, filename))
+            for filename in list_pdf_files(DOCUMENTS_DIR)
+        }
+        text_chunks = iter_document_chunks(
+            DOCUMENTS_DIR, workers=args.workers, extract_stats=extract_stats, split_stats=split_stats
+        )
+        num_chunks = create_vector_database(
+            text_chunks,
+            CHROMA_PERSIST_DIR,
+            GEMINI_API_KEY,
+            embedding_provider,
+            batch_size=args.batch_size,
+            concurrency=args.concurrency,
+            embed_stats=embed_stats,
+            insert_stats=insert_stats,
+            file_hashes=file_hashes
+        )
+        if not num_chunks:
+            print("No text extracted from any PDF files. Exiting.")
+            exit()
+
+    index_changed = counts is None or counts["added"] or counts["updated"] or counts["deleted"]
+
+    # 4. Export to the memory-mapped store when the index or the requested dtype changed
+    if args.export_mmap:
+        existing = open_vector_store(CHROMA_PERSIST_DIR, DEFAULT_COLLECTION)
+        if index_changed or existing is None or existing.header["dtype"] != args.mmap_dtype:
+            db = Chroma(persist_directory=CHROMA_PERSIST_DIR)
+            export_vector_store(db, CHROMA_PERSIST_DIR, DEFAULT_COLLECTION, args.mmap_dtype)
+            # Running app servers with VECTOR_STORE=mmap switch to it on the next question
+            bump_collection_version(CHROMA_PERSIST_DIR)
+        else:
+            print("Memory-mapped export is up to date.")
+
+    # 5. Precompute FAQ answers whenever the index changed (or has none yet)
+    if args.skip_faq or not GEMINI_API_KEY:
+        print("Skipping FAQ answers.")
+    elif index_changed or not os.path.exists(faq_path(CHROMA_PERSIST_DIR, DEFAULT_COLLECTION)):
+        print("Precomputing FAQ answers...")
+        build_faq_answers(CHROMA_PERSIST_DIR, GEMINI_API_KEY, embedding_provider)
+
+    print("\nPipeline throughput:")
+    for stage in (extract_stats, split_stats, embed_stats, insert_stats):
+        print(f"  {stage.report()}")
 
     print("\nVector database creation process finished.")
-    print("You can now run your Streamlit app.")
\ No newline at end of file
+    print("You can now run your Streamlit app.")
@@ -0,0 +1,166 @@
+"""Client for query_service.py, a stand-in for EventAssistantRAGBot in the UI.
+
+app.py uses RemoteRAGBot when QUERY_SERVICE_URL is set, so the Streamlit
+process only renders the chat while retrieval and generation run in the
+query service. It streams the answer back and returns the same response
+dict as EventAssistantRAGBot.answer_question. Uploads are indexed by the
+service too (start_remote_upload), so the app never opens Chroma itself.
+"""
+import json
+import os
+import threading
+
+import httpx
+
+QUERY_SERVICE_TIMEOUT = float(os.getenv("QUERY_SERVICE_TIMEOUT", "120"))  # Seconds per question
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_http_client(base_url):
+    """One keep-alive connection pool per service URL, shared by all sessions."""
+    with _clients_lock:
+        client = _clients.get(base_url)
+        if client is None:
+            client = _clients[base_url] = httpx.Client(
+                base_url=base_url, timeout=httpx.Timeout(QUERY_SERVICE_TIMEOUT, connect=5.0)
+            )
+        return client
+
+
+class QueryServiceError(RuntimeError):
+    pass
+
+
+class RemoteRAGBot:
+    """Answers questions through a running query_service.py."""
+
+    def __init__(self, base_url, template_type="event", collection_name=None):
+        self.base_url = base_url.rstrip("/")
+        self.template_type = template_type
+        # None lets the service use its default collection
+        self.collection_name = collection_name
+        self.http = get_http_client(self.base_url)
+
+    def answer_question(self, query, on_token=None, on_status=None):
+        """Same contract as EventAssistantRAGBot.answer_question."""
+        payload = {
+            "question": query,
+            "template": self.template_type,
+            "collection": self.collection_name,
+            "stream": on_token is not None or on_status is not None,
+        }
+        try:
+            if not payload["stream"]:
+                response = self.http.post("/answer", json=payload)
+                self._raise_for_status(response)
+                return response.json()
+            return self._stream(payload, on_token, on_status)
+        except (httpx.HTTPError, QueryServiceError, ValueError) as e:
+            print(f"Query service error: {e}")
+            return {
+                "text": f"An error occurred: query service se jawab nahi mila ({e})",
+                "vector_db_time": None,
+                "llm_time": None,
+            }
+
+    def _stream(self, payload, on_token, on_status):
+        text = ""
+        with self.http.stream("POST", "/answer", json=payload) as response:
+            self._raise_for_status(response)
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if "delta" in event:
+                    text += event["delta"]
+                    if on_token:
+                        on_token(text)
+                elif "status" in event:
+                    if on_status:
+                        on_status(event["status"])
+                elif "response" in event:
+                    return event["response"]
+                elif "error" in event:
+                    raise QueryServiceError(event["error"])
+        raise QueryServiceError("Stream ended without a response")
+
+    @staticmethod
+    def _raise_for_status(response):
+        if response.status_code != 200:
+            response.read()
+            try:
+                message = response.json().get("error")
+            except ValueError:
+                message = None
+            raise QueryServiceError(f"{response.status_code}: {message or response.text}")
+
+
+class RemoteUploadJob:
+    """Stand-in for uploads.UploadJob that polls the service for the indexing progress."""
+
+    def __init__(self, base_url, filename, content_hash, collection_name):
+        self.http = get_http_client(base_url.rstrip("/"))
+        self.filename = filename
+        self.content_hash = content_hash
+        self.collection_name = collection_name
+        self.progress = 0.0
+        self.message = "Waiting to start..."
+        self.num_chunks = 0
+        self.error = None
+        self._done = False
+
+    @property
+    def done(self):
+        """Refreshes the job's status from the service; the UI reads this on every poll."""
+        if not self._done:
+            self._refresh()
+        return self._done
+
+    def _refresh(self):
+        try:
+            response = self.http.get(f"/uploads/{self.collection_name}")
+        except httpx.HTTPError as e:
+            # Keep polling; the next tick may reach the service again
+            print(f"Query service error: {e}")
+            return
+        if response.status_code == 404:
+            self.error = "The query service has no record of this upload"
+            self.message = f"Could not index {self.filename}: {self.error}"
+            self._done = True
+            return
+        if response.status_code != 200:
+            print(f"Query service error: {response.status_code}")
+            return
+        status = response.json()
+        self.progress = status["progress"]
+        self.message = status["message"]
+        self.num_chunks = status["num_chunks"]
+        self.error = status["error"]
+        self._done = status["done"]
+
+
+def start_remote_upload(base_url, session_id, data, filename, content_hash):
+    """Sends an uploaded file to the query service for indexing; returns its RemoteUploadJob."""
+    http = get_http_client(base_url.rstrip("/"))
+    try:
+        response = http.post("/uploads", params={"session": session_id, "filename": filename}, content=data)
+        RemoteRAGBot._raise_for_status(response)
+        collection_name = response.json()["collection"]
+    except (httpx.HTTPError, QueryServiceError, ValueError, KeyError) as e:
+        job = RemoteUploadJob(base_url, filename, content_hash, None)
+        job.error = str(e)
+        job.message = f"Could not index {filename}: {e}"
+        job._done = True
+        return job
+    return RemoteUploadJob(base_url, filename, content_hash, collection_name)
+
+
+def delete_remote_collection(base_url, collection_name):
+    """Deletes an upload collection in the query service; errors are only printed."""
+    try:
+        response = get_http_client(base_url.rstrip("/")).delete(f"/collections/{collection_name}")
+        RemoteRAGBot._raise_for_status(response)
+    except (httpx.HTTPError, QueryServiceError) as e:
+        print(f"Could not delete collection {collection_name}: {e}")
@@ -0,0 +1,396 @@
+"""Standalone RAG query service that Streamlit frontends (and anything else) call into.
+
+With QUERY_SERVICE_URL set, app.py sends questions here instead of running
+retrieval and generation in its own script threads. A service process keeps
+one warm copy of the index and the pooled Gemini client and answers many
+questions at once: an asyncio server handles the connections, and the
+blocking pipeline (EventAssistantRAGBot.answer_question) runs on a pool of
+QUERY_WORKERS threads. Use --processes to spread the query tier over more
+cores: the processes share the port (SO_REUSEPORT) and, with
+VECTOR_STORE=mmap, the index pages in memory. Run it on other hosts and
+point the frontends at a load balancer to scale it separately from the UI.
+
+    python query_service.py --port 8700 --workers 8 --processes 2
+    QUERY_SERVICE_URL=http://127.0.0.1:8700 streamlit run app.py
+
+API (JSON over HTTP/1.1, keep-alive):
+
+    POST /answer   {"question", "template"?, "collection"?, "stream"?}
+                   Returns the answer_question dict. With "stream": true the
+                   reply is NDJSON: {"status": ...} and {"delta": ...} lines
+                   while the answer is generated, then {"response": {...}}.
+                   "collection" must be the default collection or an indexed
+                   upload; anything else is a 404.
+    POST /uploads?session=<id>&filename=<name>
+                   The file's bytes as the body. Starts indexing it into the
+                   session's upload collection: {"collection", "content_hash"}
+    GET  /uploads/<collection>
+                   Indexing progress: {"progress", "message", "done", "error", ...}
+    DELETE /collections/<collection>
+                   Deletes an upload collection (never the default one)
+    GET  /health   {"status": "ok", "pid", "workers", "pending", "warm_up"}
+    GET  /metrics  Per-stage latency histograms (tracing.py)
+
+When more than QUERY_MAX_PENDING questions are queued or running, new ones
+get a 503 straight away instead of waiting behind a growing queue.
+
+Uploads are indexed into the service's Chroma directory, and their progress
+is saved next to it, so with --processes any process can report it. Several
+hosts need a shared Chroma directory, or sticky sessions at the load balancer.
+
+Everything runs offline against the stub Gemini API (embeddings and LLM):
+
+    python stub_gemini_server.py --latency 0.3 &
+    GEMINI_BASE_URL=http://127.0.0.1:8765 GEMINI_API_KEY=stub python query_service.py
+"""
+import sys
+try:
+    __import__('pysqlite3')
+    sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
+except ImportError:
+    pass
+
+import time
+_import_start = time.perf_counter()
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import hashlib
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import environment
+from api_clients import stats as api_stats
+from embedding_providers import EMBEDDING_PROVIDER, PROVIDERS, get_embedding_provider
+from rag_bot import EventAssistantRAGBot
+from retriever import (
+    DEFAULT_COLLECTION, SESSION_COLLECTION_PREFIX, cleanup_expired_collections, delete_collection,
+    read_collection_version
+)
+from tracing import tracer
+from uploads import read_upload_status, start_upload_job
+from warmup import warm_up
+
+IMPORT_SECONDS = time.perf_counter() - _import_start
+
+QUERY_SERVICE_HOST = os.getenv("QUERY_SERVICE_HOST", "127.0.0.1")
+QUERY_SERVICE_PORT = int(os.getenv("QUERY_SERVICE_PORT", "8700"))
+QUERY_WORKERS = int(os.getenv("QUERY_WORKERS", "8"))
+QUERY_MAX_PENDING = int(os.getenv("QUERY_MAX_PENDING", "64"))
+QUERY_MAX_UPLOAD_MB = int(os.getenv("QUERY_MAX_UPLOAD_MB", "50"))
+MAX_BODY_BYTES = 1 << 20
+TEMPLATE_TYPES = ("event", "resume")
+UPLOAD_TYPES = (".pdf", ".txt", ".docx")
+
+# Session IDs and collection names end up in file names next to the Chroma data
+_SESSION_ID_RE = re.compile(r"[A-Za-z0-9]{1,64}")
+_COLLECTION_RE = re.compile(r"[A-Za-z0-9_-]{1,128}")
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large", 503: "Service Unavailable"}
+
+
+class BadRequest(ValueError):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+async def read_request(reader):
+    """Reads one HTTP request; returns (method, path, query, headers, body), or None at end of stream."""
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    try:
+        method, target, _version = request_line.decode("latin-1").split()
+    except ValueError:
+        raise BadRequest("Malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    url = urlsplit(target)
+    length = int(headers.get("content-length") or 0)
+    # Uploaded files are the only big bodies
+    limit = QUERY_MAX_UPLOAD_MB << 20 if url.path == "/uploads" else MAX_BODY_BYTES
+    if length > limit:
+        raise BadRequest("Request body too large", 413)
+    body = await reader.readexactly(length) if length else b""
+    query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+    return method.upper(), unquote(url.path), query, headers, body
+
+
+def _head(status, content_type, extra=""):
+    return (f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n{extra}").encode("latin-1")
+
+
+async def send_json(writer, status, payload):
+    body = json.dumps(payload, default=str).encode("utf-8")
+    writer.write(_head(status, "application/json", f"Content-Length: {len(body)}\r\n\r\n") + body)
+    await writer.drain()
+
+
+class QueryService:
+    """Answers questions on a thread pool; one instance per service process."""
+
+    def __init__(self, chroma_path, api_key, workers=QUERY_WORKERS, max_pending=QUERY_MAX_PENDING,
+                 embedding_provider=None):
+        self.chroma_path = chroma_path
+        self.api_key = api_key
+        self.workers = workers
+        self.max_pending = max_pending
+        self.embedding_provider = embedding_provider or get_embedding_provider()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query")
+        self.pending = 0  # Only touched on the event loop thread
+        self.warm_up_report = None
+        self.upload_jobs = {}  # Collection name -> UploadJob started by this process
+
+    def warm_up(self):
+        self.warm_up_report = warm_up(
+            self.chroma_path, self.api_key, embedding_provider=self.embedding_provider, import_seconds=IMPORT_SECONDS
+        )
+
+    def make_bot(self, template_type, collection_name):
+        return EventAssistantRAGBot(
+            self.api_key, self.chroma_path, template_type, collection_name, embedding_provider=self.embedding_provider
+        )
+
+    def is_known_collection(self, collection_name):
+        """The default collection, or an upload collection that finished indexing.
+
+        Never opens Chroma, so asking for an unknown name can't create it.
+        """
+        if collection_name == DEFAULT_COLLECTION:
+            return True
+        return (collection_name.startswith(SESSION_COLLECTION_PREFIX)
+                and _COLLECTION_RE.fullmatch(collection_name) is not None
+                and read_collection_version(self.chroma_path, collection_name) is not None)
+
+    def answer(self, question, template_type, collection_name, enqueued, on_token=None, on_status=None):
+        """Runs on a worker thread. Bots are cheap; the retriever and client behind them are shared."""
+        queue_seconds = time.perf_counter() - enqueued
+        bot = self.make_bot(template_type, collection_name)
+        response = bot.answer_question(question, on_token=on_token, on_status=on_status)
+        response["service"] = {"pid": os.getpid(), "queue_seconds": queue_seconds}
+        return response
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except BadRequest as e:
+                    await send_json(writer, e.status, {"error": str(e)})
+                    break
+                if request is None:
+                    break
+                method, path, query, headers, body = request
+                await self.dispatch(method, path, query, body, writer)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # The client went away
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, path, query, body, writer):
+        if path == "/health":
+            await send_json(writer, 200, {
+                "status": "ok",
+                "pid": os.getpid(),
+                "workers": self.workers,
+                "pending": self.pending,
+                "warm_up": self.warm_up_report,
+            })
+        elif path == "/metrics":
+            await send_json(writer, 200, {**tracer.snapshot(), "upstream": api_stats()})
+        elif path == "/answer":
+            if method != "POST":
+                await send_json(writer, 405, {"error": "Use POST"})
+                return
+            try:
+                payload = json.loads(body or b"{}")
+            except ValueError:
+                await send_json(writer, 400, {"error": "Body must be JSON"})
+                return
+            if not isinstance(payload, dict):
+                payload = {}
+            question = payload.get("question")
+            template_type = payload.get("template") or "event"
+            collection_name = payload.get("collection") or DEFAULT_COLLECTION
+            if (not isinstance(question, str) or not question.strip() or template_type not in TEMPLATE_TYPES
+                    or not isinstance(collection_name, str)):
+                await send_json(writer, 400, {"error": "Expected {\"question\": str, \"template\": event|resume}"})
+                return
+            if not self.is_known_collection(collection_name):
+                await send_json(writer, 404, {"error": f"Unknown collection: {collection_name}"})
+                return
+            if self.pending >= self.max_pending:
+                await send_json(writer, 503, {"error": f"Busy: {self.pending} questions pending"})
+                return
+            self.pending += 1
+            try:
+                args = (question, template_type, collection_name, time.perf_counter())
+                if payload.get("stream"):
+                    await self.stream_answer(args, writer)
+                else:
+                    loop = asyncio.get_running_loop()
+                    response = await loop.run_in_executor(self.executor, self.answer, *args)
+                    await send_json(writer, 200, response)
+            finally:
+                self.pending -= 1
+        elif path == "/uploads":
+            if method != "POST":
+                await send_json(writer, 405, {"error": "Use POST"})
+                return
+            await self.start_upload(query, body, writer)
+        elif path.startswith("/uploads/") and method == "GET":
+            collection_name = path[len("/uploads/"):]
+            job = self.upload_jobs.get(collection_name)
+            # Another service process may have started it
+            status = job.status() if job is not None else read_upload_status(self.chroma_path, collection_name)
+            if status is None:
+                await send_json(writer, 404, {"error": f"No upload for {collection_name}"})
+            else:
+                await send_json(writer, 200, status)
+        elif path.startswith("/collections/") and method == "DELETE":
+            collection_name = path[len("/collections/"):]
+            if not collection_name.startswith(SESSION_COLLECTION_PREFIX) or not _COLLECTION_RE.fullmatch(collection_name):
+                await send_json(writer, 404, {"error": f"Unknown collection: {collection_name}"})
+                return
+            self.upload_jobs.pop(collection_name, None)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, delete_collection, self.chroma_path, collection_name)
+            await send_json(writer, 200, {"deleted": collection_name})
+        else:
+            await send_json(writer, 404, {"error": f"No route for {path}"})
+
+    async def start_upload(self, query, data, writer):
+        session_id = query.get("session", "")
+        filename = os.path.basename(query.get("filename", ""))
+        if not _SESSION_ID_RE.fullmatch(session_id) or not filename.lower().endswith(UPLOAD_TYPES):
+            await send_json(writer, 400, {"error": "Expected ?session=<letters and digits>&filename=<name>.pdf|txt|docx"})
+            return
+        if not data:
+            await send_json(writer, 400, {"error": "The body must be the file's bytes"})
+            return
+        loop = asyncio.get_running_loop()
+        content_hash = await loop.run_in_executor(self.executor, lambda: hashlib.sha256(data).hexdigest())
+        # A new upload is when the app used to clean up; uploads are where the disk goes
+        try:
+            await loop.run_in_executor(self.executor, cleanup_expired_collections, self.chroma_path)
+        except Exception as e:
+            print(f"Could not clean up expired collections: {type(e).__name__}: {e}")
+        job = start_upload_job(
+            self.chroma_path, self.api_key, session_id, data, filename, content_hash, save_status=True,
+            embedding_provider=self.embedding_provider
+        )
+        # Only the latest job per collection is interesting; finished ones can go
+        for name in [name for name, old_job in self.upload_jobs.items() if old_job.done]:
+            del self.upload_jobs[name]
+        self.upload_jobs[job.collection_name] = job
+        await send_json(writer, 200, {"collection": job.collection_name, "content_hash": content_hash})
+
+    async def stream_answer(self, args, writer):
+        """Sends status and text deltas as NDJSON chunks while a worker answers."""
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+
+        def emit(event):
+            loop.call_soon_threadsafe(events.put_nowait, event)
+
+        sent = 0
+
+        def on_token(text):
+            nonlocal sent
+            emit({"delta": text[sent:]})
+            sent = len(text)
+
+        def run():
+            try:
+                emit({"response": self.answer(*args, on_token=on_token, on_status=lambda status: emit({"status": status}))})
+            except Exception as e:
+                emit({"error": f"{type(e).__name__}: {e}"})
+            finally:
+                emit(None)
+
+        self.executor.submit(run)
+        writer.write(_head(200, "application/x-ndjson", "Transfer-Encoding: chunked\r\n\r\n"))
+        while True:
+            event = await events.get()
+            if event is None:
+                break
+            data = json.dumps(event, default=str).encode("utf-8") + b"\n"
+            writer.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+async def serve(service, host, port, reuse_port=False):
+    server = await asyncio.start_server(service.handle_connection, host, port, reuse_port=reuse_port or None)
+    print(f"Query service (pid {os.getpid()}) listening on http://{host}:{port} with {service.workers} workers")
+    async with server:
+        await server.serve_forever()
+
+
+def run_process(chroma_path, api_key, host, port, workers, max_pending, embedding_provider_name, reuse_port):
+    """One service process: warm up first, then accept connections."""
+    service = QueryService(
+        chroma_path, api_key, workers, max_pending, get_embedding_provider(embedding_provider_name)
+    )
+    service.warm_up()
+    try:
+        asyncio.run(serve(service, host, port, reuse_port))
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve Event Bot answers over HTTP.")
+    parser.add_argument("--host", default=QUERY_SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=QUERY_SERVICE_PORT)
+    parser.add_argument("--workers", type=int, default=QUERY_WORKERS, help="Questions answered at the same time per process")
+    parser.add_argument("--processes", type=int, default=1, help="Service processes sharing the port")
+    parser.add_argument("--max-pending", type=int, default=QUERY_MAX_PENDING,
+                        help="Questions queued or running per process before new ones get a 503")
+    parser.add_argument("--chroma", default="chroma", help="Chroma directory")
+    parser.add_argument("--embedding-provider", choices=sorted(PROVIDERS), default=EMBEDDING_PROVIDER)
+    args = parser.parse_args()
+
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        print("Error: GEMINI_API_KEY not found in .env file.", file=sys.stderr)
+        sys.exit(1)
+    if not os.path.exists(args.chroma):
+        print(f"Error: Chroma directory '{args.chroma}' not found. Run populatedb.py first.", file=sys.stderr)
+        sys.exit(1)
+
+    options = (args.chroma, api_key, args.host, args.port, args.workers, args.max_pending,
+               args.embedding_provider, args.processes > 1)
+    if args.processes <= 1:
+        run_process(*options)
+        return
+    # Fresh interpreters, so no threads or connections are inherited from this one
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=run_process, args=options, name=f"query-{i}") for i in range(args.processes)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""The Event Bot's RAG pipeline: retrieval from Chroma plus generation with Gemini.
+
+Kept separate from app.py, and free of Streamlit calls, so the bot can run
+without the Streamlit page, e.g. in benchmark.py and batch_qa.py.
+"""
+import threading
+import time
+
+from google.genai import types
+from langchain.prompts import PromptTemplate
+
+from api_clients import get_genai_client
+from context_packing import CONTEXT_CANDIDATES, CONTEXT_TOKEN_BUDGET, estimate_tokens, pack_context
+from intent_router import greeting_answer, match_faq, match_greeting
+from retriever import DEFAULT_COLLECTION, get_shared_retriever
+from tracing import Trace, tracer
+
+
+# Static instructions: sent as Gemini's system instruction, so every request
+# for a template type starts with the same prefix (which Gemini can cache)
+SYSTEM_INSTRUCTIONS = {
+    "resume": """You are a helpful Resume Assistant. Your primary purpose is to answer questions about the uploaded resume described in the provided context. Follow these guidelines:
+
+1. Only provide details that are present in the resume context.
+2. If information is not in the context, politely say "Sorry, this information is not available in the uploaded resume."
+3. Keep responses concise and factual.
+4. Do not make assumptions beyond what's in the resume.
+5. Refer to yourself as "Resume Assistant".""",
+    "event": """You are a friendly Event Information Assistant. Your primary purpose is to answer questions about the event described in the provided context. Follow these guidelines:
+
+1. You can respond to basic greetings like "hi", "hello", or "how are you" in a warm, welcoming manner
+2. For event information, only provide details that are present in the context
+3. If information is not in the context, politely say "I'm sorry, I don't have that specific information about the event"
+4. Keep responses concise but conversational
+5. Do not make assumptions beyond what's explicitly stated in the context
+6. Always prioritize factual accuracy while maintaining a helpful tone
+7. Do not introduce information that isn't in the context
+8. If unsure about any information, acknowledge uncertainty rather than guess
+9. You may suggest a few general questions users might want to ask about the event
+10. Remember to maintain a warm, friendly tone in all interactions
+11. You should refer to yourself as "Event Bot"
+12. You should not greet if the user has not greeted to you
+
+Remember: While you can be conversational, your primary role is providing accurate information about this specific event based on the context provided.""",
+}
+
+# The per-question part, sent as the user message
+PROMPT_TEMPLATES = {
+    "resume": """Resume context:
+{context}
+--------
+Now, please answer this question about the resume: {question}""",
+    "event": """Context information about the event:
+{context}
+--------
+Now, please answer this question about the event: {question}""",
+}
+
+_compiled_prompts = {}  # template type -> (PromptTemplate, GenerateContentConfig)
+_compiled_prompts_lock = threading.Lock()
+
+
+def get_compiled_prompt(template_type):
+    """The user message template and generate config for a template type, built once per process."""
+    template_type = "resume" if template_type == "resume" else "event"
+    # Warm-up and the first questions can ask at the same time; all get the same objects
+    with _compiled_prompts_lock:
+        compiled = _compiled_prompts.get(template_type)
+        if compiled is None:
+            compiled = (
+                PromptTemplate.from_template(PROMPT_TEMPLATES[template_type]),
+                types.GenerateContentConfig(system_instruction=SYSTEM_INSTRUCTIONS[template_type]),
+            )
+            _compiled_prompts[template_type] = compiled
+        return compiled
+
+
+def token_counts(usage, prompt, answer):
+    """Prompt, cached and output token counts for one Gemini call.
+
+    Uses the usage metadata Gemini reports; stand-in clients that report none
+    get the same rough estimate as the context packer, flagged as estimated.
+    """
+    if usage is not None and usage.prompt_token_count is not None:
+        return {
+            "prompt": usage.prompt_token_count,
+            "cached": usage.cached_content_token_count or 0,
+            "output": usage.candidates_token_count or 0,
+            "estimated": False,
+        }
+    return {"prompt": estimate_tokens(prompt), "cached": 0, "output": estimate_tokens(answer), "estimated": True}
+
+
+class EventAssistantRAGBot:
+    def __init__(self, api_key, chroma_path="/chroma", template_type="event", collection_name=DEFAULT_COLLECTION,
+                 client=None, embedding_provider=None):
+        self.api_key = api_key
+        self.chroma_path = chroma_path
+        self.collection_name = collection_name
+        # Shared across all sessions in this server process that query this collection
+        self.retriever = get_shared_retriever(
+            chroma_path, api_key, embedding_provider=embedding_provider, collection_name=collection_name
+        )
+        # Shared, pooled Gemini client (benchmark.py passes a local stub instead)
+        self.client = client or get_genai_client(self.api_key)
+        self.set_prompt_template(template_type)
+
+    def set_prompt_template(self, template_type="event"):
+        self.template_type = template_type
+        self.prompt_template, self.generate_config = get_compiled_prompt(template_type)
+
+    def post_process_response(self, response, query):
+        """Format responses for better readability based on query type."""
+        # If it's a lunch-related query, format the response
+        if "lunch" in query.lower() or "food" in query.lower() or "eat" in query.lower():
+            # Just start with "Regarding lunch:" without the greeting
+            formatted = "Regarding lunch:\n\n"
+            
+            # Split into readable bullet points
+            points = []
+            
+            # Extract key information using common phrases and format as separate points
+            if "provided to all" in response:
+                points.append("• Lunch will be provided to all participants who have checked in at the venue.")
+            if "cafeteria" in response.lower() and "floor" in response.lower():
+                # Extract time info if available
+                time_info = ""
+                if "1:00" in response and "2:00" in response:
+                    time_info = "between 1:00 PM and 2:00 PM IST"
+                points.append(f"• It will be served in the Cafeteria on the 5th floor {time_info}.")
+            if "check-in" in response.lower() or "registration" in response.lower():
+                points.append("• Please ensure you've completed the check-in process at the registration desk to be eligible.")
+            if "volunteer" in response.lower() or "direction" in response.lower():
+                points.append("• Feel free to ask a volunteer if you need directions to the cafeteria.")
+                
+            # If we couldn't extract structured points, just use the original
+            if not points:
+                return response
+                
+            # Combine all points with line breaks
+            return formatted + "\n".join(points)
+        
+        # For other responses, just return the original
+        return response
+
+    def route(self, query):
+        """Returns (intent, answer) for greetings and precomputed FAQs, else (intent or None, None)."""
+        intent = match_greeting(query)
+        if intent is not None:
+            return intent, greeting_answer(intent, self.template_type)
+        intent = match_faq(query)
+        if intent is not None and self.template_type == "event":
+            return intent, self.retriever.faq_answer(intent)
+        return None, None
+
+    def answer_question(self, query, on_token=None, on_status=None):
+        """Use RAG with Google Gemini to answer a question based on retrieved context.
+
+        If on_token is given the answer is streamed: it is called with the text
+        received so far every time a new chunk arrives from Gemini. on_status,
+        if given, is called with a short message as each phase starts; the UI
+        shows it in place of a spinner, so the bot itself never touches
+        Streamlit. Every stage is recorded as a span; the finished trace is
+        returned under "trace" and aggregated into the process-wide metrics.
+        """
+        trace = Trace(template_type=self.template_type, collection=self.collection_name)
+        first_token_time = None
+        retriever_stats = {"cold": False, "open_time": 0.0}
+        try:
+            # Greetings and known FAQs are answered before any retrieval or LLM call
+            with trace.span("route") as span:
+                intent, routed_text = self.route(query)
+                span["intent"] = intent
+            if routed_text is not None:
+                trace.attributes["intent"] = intent
+                return self._finish(trace, {"text": routed_text, "retriever": None, "intent": intent})
+
+            if on_status is not None:
+                on_status("Retrieving relevant information...")
+            # Retrieve relevant documents from the shared Chroma store
+            results, query_embedding, retriever_stats = self.retriever.retrieve(
+                query, k=CONTEXT_CANDIDATES, trace=trace
+            )
+            # Merge overlapping chunks and fit the rest into the token budget
+            with trace.span("context_pack", budget=CONTEXT_TOKEN_BUDGET) as span:
+                context_text, chunk_ids, pack_stats = pack_context(results)
+                span.update(pack_stats)
+
+            # --- ADD THIS: If no relevant context found, return custom message ---
+            if not context_text.strip():
+                return self._finish(trace, {
+                    "text": "File me aisi jankari nahi hai.",
+                    "retriever": retriever_stats
+                })
+            # --- END ADD ---
+
+            # Near-duplicate of an already answered question? Skip the LLM.
+            collection_version = self.retriever.version
+            with trace.span("answer_cache_lookup") as span:
+                cached_response_text = self.retriever.answer_cache.lookup(
+                    query_embedding, chunk_ids, self.template_type, collection_version
+                )
+                span["hit"] = cached_response_text is not None
+            if cached_response_text is not None:
+                with trace.span("post_process"):
+                    processed_response_text = self.post_process_response(cached_response_text, query)
+                return self._finish(trace, {
+                    "text": processed_response_text,
+                    "retriever": retriever_stats,
+                    "answer_cached": True
+                })
+
+            # Format the per-question part; the instructions go in generate_config
+            with trace.span("prompt_format") as span:
+                prompt = self.prompt_template.format(context=context_text, question=query)
+                system_instruction = self.generate_config.system_instruction
+                span["system_chars"] = len(system_instruction)
+                span["prompt_chars"] = len(prompt)
+                # Rough estimate; the LLM span records the real count when Gemini reports it
+                span["prompt_tokens_est"] = estimate_tokens(system_instruction) + estimate_tokens(prompt)
+
+                # Create the content for Gemini
+                contents = [
+                    types.Content(
+                        role="user",
+                        parts=[
+                            types.Part.from_text(text=prompt),
+                        ],
+                    ),
+                ]
+            
+            if on_status is not None:
+                on_status("Generating response...")
+            with trace.span("llm", model="gemini-2.0-flash", streamed=on_token is not None) as span:
+                start_time = time.time()
+                if on_token is None:
+                    # Generate response using Gemini 2.0 Flash model
+                    response = self.client.models.generate_content(
+                        model="gemini-2.0-flash",  # Using Gemini 2.0 Flash model
+                        contents=contents,
+                        config=self.generate_config,
+                    )
+                    raw_response_text = response.text
+                else:
+                    # Stream the answer so the user sees it being written
+                    raw_response_text = ""
+                    response = None
+                    for chunk in self.client.models.generate_content_stream(
+                        model="gemini-2.0-flash",
+                        contents=contents,
+                        config=self.generate_config,
+                    ):
+                        response = chunk  # The last chunk carries the usage metadata
+                        if not chunk.text:
+                            continue
+                        if first_token_time is None:
+                            first_token_time = time.time() - start_time
+                        raw_response_text += chunk.text
+                        on_token(raw_response_text)
+                    span["first_token_time"] = first_token_time
+                tokens = token_counts(getattr(response, "usage_metadata", None), system_instruction + prompt,
+                                      raw_response_text)
+                span["prompt_tokens"] = tokens["prompt"]
+                span["cached_tokens"] = tokens["cached"]
+                span["output_tokens"] = tokens["output"]
+                span["tokens_estimated"] = tokens["estimated"]
+                span["answer_chars"] = len(raw_response_text)
+
+            self.retriever.answer_cache.store(
+                query_embedding, chunk_ids, self.template_type, collection_version, raw_response_text
+            )
+            with trace.span("post_process"):
+                processed_response_text = self.post_process_response(raw_response_text, query)
+
+            # Return a dictionary including the text and timings
+            return self._finish(trace, {
+                "text": processed_response_text,
+                "first_token_time": first_token_time,
+                "tokens": tokens,
+                "retriever": retriever_stats
+            })
+
+        except Exception as e:
+            # In case of error, return the error message with the timings so far
+            trace.attributes["error"] = type(e).__name__
+            return self._finish(trace, {
+                "text": f"An error occurred: {str(e)}",
+                "retriever": retriever_stats
+            })
+
+    def _finish(self, trace, response):
+        """Records the trace and adds the stage timings to the response dict."""
+        tracer.record(trace)
+        response["vector_db_time"] = trace.duration_of("open", "lexical", "embed", "search", "fuse", "context_pack")
+        response["llm_time"] = trace.duration_of("llm")
+        response["trace"] = trace.to_dict()
+        return response
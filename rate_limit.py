@@ -0,0 +1,36 @@
+"""Token-bucket rate limiting for calls to the Gemini APIs."""
+import threading
+import time
+
+
+class TokenBucket:
+    """Allows `rate` calls per second on average, in bursts of up to `capacity`.
+
+    Thread-safe; a rate of None or 0 means no limit.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate or 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.waited = 0.0  # Total seconds callers spent blocked
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1.0):
+        """Blocks until `tokens` are available; returns the seconds spent waiting."""
+        if not self.rate:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    self.waited += waited
+                    return waited
+                delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
@@ -0,0 +1,436 @@
+"""Process-wide shared retriever for the Event Bot.
+
+Streamlit re-executes app.py on every rerun and for every session, so anything
+built at the top of the script is rebuilt over and over. Imported modules are
+only loaded once per server process, which makes this the place to keep the
+embeddings client and the open Chroma store alive between questions.
+
+The event documents live in the default collection. Uploads go to one
+collection per session (see session_collection_name) so one user's upload
+never replaces another user's context; those collections are dropped once
+nobody has queried them for SESSION_TTL_SECONDS.
+
+Retrieval is hybrid: a local BM25 index (bm25_index.py) is searched first and
+fused with the vector results. A confident keyword match, or an embedding
+call slower than EMBED_TIMEOUT_SECONDS, answers from the keyword index alone.
+
+With VECTOR_STORE=mmap, collections exported by populatedb.py are searched
+in the memory-mapped store (vector_store.py) instead of Chroma; the rest
+(uploads, collections without an export) still use Chroma.
+"""
+import glob
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from langchain_chroma import Chroma
+
+from answer_cache import SemanticAnswerCache
+from bm25_index import bm25_path, load_bm25_index, reciprocal_rank_fusion
+from embedding_cache import CachedEmbeddings
+from embedding_providers import get_embedding_provider
+from intent_router import faq_path, load_faq_answers
+from tracing import Trace
+from vector_store import VECTOR_STORE, open_vector_store, remove_vector_store
+
+DEFAULT_COLLECTION = "langchain"  # langchain_chroma's default, used by populatedb.py
+SESSION_COLLECTION_PREFIX = "session_"
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(6 * 60 * 60)))
+LAST_USED_INTERVAL = 60  # Seconds between last_used writes for session collections
+COLLECTION_VERSION_FILE = "collection_version"
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")  # "hybrid" or "vector"
+EMBED_TIMEOUT_SECONDS = float(os.getenv("EMBED_TIMEOUT_SECONDS", "2.0"))
+CANDIDATES_PER_RESULT = 2  # Each ranking contributes k * this many candidates to the fusion
+
+# Embedding calls that may be abandoned for the lexical fallback run here; an
+# abandoned call still finishes and fills the embedding cache for next time
+_embed_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="embed")
+
+
+def _version_path(chroma_path, collection_name):
+    return os.path.join(chroma_path, f"{COLLECTION_VERSION_FILE}.{collection_name}")
+
+
+def upload_status_path(chroma_path, collection_name):
+    """Where uploads.py keeps the indexing status of an upload collection."""
+    return os.path.join(chroma_path, f"upload_status.{collection_name}.json")
+
+
+def read_collection_version(chroma_path, collection_name=DEFAULT_COLLECTION):
+    """Returns the version marker written next to the Chroma data, or None."""
+    try:
+        with open(_version_path(chroma_path, collection_name)) as file:
+            return file.read().strip() or None
+    except OSError:
+        return None
+
+
+def bump_collection_version(chroma_path, collection_name=DEFAULT_COLLECTION):
+    """Marks the collection as changed; call after every rebuild or upload."""
+    os.makedirs(chroma_path, exist_ok=True)
+    version = uuid.uuid4().hex
+    with open(_version_path(chroma_path, collection_name), "w") as file:
+        file.write(version)
+    return version
+
+
+def session_collection_name(session_id, content_hash=None):
+    """Name of the collection that holds one session's uploaded file.
+
+    With a content hash every distinct upload gets its own collection, so a new
+    file can be indexed while the session keeps querying the previous one.
+    """
+    if content_hash is None:
+        return f"{SESSION_COLLECTION_PREFIX}{session_id}"
+    return f"{SESSION_COLLECTION_PREFIX}{session_id}_{content_hash[:12]}"
+
+
+_embedding_functions = {}
+_embedding_functions_lock = threading.Lock()
+
+
+def get_shared_embeddings(api_key, embedding_provider=None):
+    """Returns the process-wide embeddings client for a provider (the configured one by default)."""
+    embedding_provider = embedding_provider or get_embedding_provider()
+    with _embedding_functions_lock:
+        embedding_function = _embedding_functions.get(embedding_provider.key)
+        if embedding_function is None:
+            embedding_function = embedding_provider.create(api_key)
+            if embedding_provider.cache_queries:
+                # Repeat questions are answered from the query embedding cache
+                embedding_function = CachedEmbeddings(embedding_function, embedding_provider.model)
+            _embedding_functions[embedding_provider.key] = embedding_function
+        return embedding_function
+
+
+class SharedRetriever:
+    """Lazily opens one collection (Chroma or its mmap export) and reuses it across sessions and threads."""
+
+    def __init__(self, chroma_path, api_key, embedding_provider=None, collection_name=DEFAULT_COLLECTION):
+        self.chroma_path = chroma_path
+        self.api_key = api_key
+        self.embedding_provider = embedding_provider or get_embedding_provider()
+        self.collection_name = collection_name
+        self.vector_store = VECTOR_STORE
+        # Session collections record when they were last queried for TTL cleanup
+        self.track_last_used = collection_name.startswith(SESSION_COLLECTION_PREFIX)
+        self._last_used_written = 0.0
+        self._lock = threading.Lock()
+        self._db = None
+        self.bm25 = None
+        self.faq_answers = None
+        self.embedding_function = None
+        # Called in the asking thread before a query embedding that needs the API (batch_qa's rate limit)
+        self.embed_gate = None
+        self.version = None
+        self.answer_cache = SemanticAnswerCache()
+        # Cold = the query that had to open the store, warm = everything after
+        self.open_time = None
+        self.cold_queries = 0
+        self.warm_queries = 0
+        self.warm_time_total = 0.0
+
+    def get_embedding_function(self):
+        """Returns the shared embeddings client, e.g. for indexing an upload."""
+        if self.embedding_function is None:
+            self.embedding_function = get_shared_embeddings(self.api_key, self.embedding_provider)
+        return self.embedding_function
+
+    def _open(self):
+        """Builds the embeddings client and opens the store. Caller holds the lock."""
+        start_time = time.time()
+        self.get_embedding_function()
+        self.version = read_collection_version(self.chroma_path, self.collection_name)
+        db = open_vector_store(self.chroma_path, self.collection_name) if self.vector_store == "mmap" else None
+        if db is not None:
+            kind = "mmap"
+            self.embedding_provider.check(db.metadata, dimension=db.dimension, where=f"export of {self.collection_name}")
+        else:
+            kind = "Chroma"
+            db = Chroma(
+                collection_name=self.collection_name,
+                persist_directory=self.chroma_path,
+                embedding_function=self.embedding_function
+            )
+            # Refuse to search vectors made by another backend; older collections only have their dimension
+            self.embedding_provider.check(
+                db._collection.metadata,
+                dimension=getattr(getattr(db._collection, "_model", None), "dimension", None),
+                where=f"collection {self.collection_name}"
+            )
+        self._db = db
+        # Collections indexed before hybrid retrieval have no keyword index; they stay vector-only
+        self.bm25 = load_bm25_index(self.chroma_path, self.collection_name) if RETRIEVAL_MODE == "hybrid" else None
+        self.faq_answers = load_faq_answers(self.chroma_path, self.collection_name)
+        self.open_time = time.time() - start_time
+        print(f"Opened shared {kind} collection {self.collection_name} at {self.chroma_path} "
+              f"in {self.open_time:.2f}s (cold start)")
+
+    def _is_current(self):
+        return read_collection_version(self.chroma_path, self.collection_name) == self.version
+
+    def get_db(self):
+        """Returns the open store and whether this call had to open it.
+
+        The store is reopened when the version marker on disk no longer matches,
+        so a populatedb.py rebuild is picked up without restarting the server.
+        """
+        db = self._db
+        if db is not None and self._is_current():
+            return db, False
+        with self._lock:
+            # Another script run may have reopened it while we were waiting
+            if self._db is not None and self._is_current():
+                return self._db, False
+            self._open()
+            return self._db, True
+
+    def load_vectors(self):
+        """Opens the store and runs one search with a dummy vector, so the vector
+        data (Chroma's HNSW segment or the mmap pages) is in memory before the
+        first question. Returns the number of vectors it was run against.
+        """
+        db, _cold = self.get_db()
+        dimension = self.embedding_provider.dimension or getattr(db, "dimension", None)
+        if not dimension:
+            return 0
+        probe = [1.0] + [0.0] * (dimension - 1)
+        db.similarity_search_by_vector_with_relevance_scores(probe, k=1)
+        return db._collection.count() if isinstance(db, Chroma) else db.count
+
+    def _touch(self, db):
+        """Writes last_used into the collection metadata, at most once a minute."""
+        now = time.time()
+        if now - self._last_used_written < LAST_USED_INTERVAL:
+            return
+        self._last_used_written = now
+        # hnsw:* settings can't be passed to modify(), everything else is kept
+        metadata = {k: v for k, v in (db._collection.metadata or {}).items() if not k.startswith("hnsw:")}
+        metadata["last_used"] = now
+        db._collection.modify(metadata=metadata)
+
+    def faq_answer(self, intent):
+        """The answer precomputed for an FAQ intent, if the store is open and still current.
+
+        Never opens the store itself: a cold retriever just misses and the
+        question takes the normal path, which loads the FAQ table.
+        """
+        faq_answers = self.faq_answers
+        if self._db is None or not faq_answers or not self._is_current():
+            return None
+        return faq_answers.get(intent)
+
+    def _embed_query(self, query, timeout=None):
+        """Embeds the query; returns None if that takes longer than `timeout` seconds."""
+        # Cache hits never wait on the gate or the executor
+        lookup = getattr(self.embedding_function, "lookup", None)
+        query_embedding = lookup(query) if lookup is not None else None
+        if query_embedding is not None:
+            return query_embedding
+        # Outside the timeout: waiting for the gate is not the API being slow
+        if self.embed_gate is not None:
+            self.embed_gate()
+        if timeout is None:
+            return self.embedding_function.embed_query(query)
+        started = threading.Event()
+
+        def embed():
+            started.set()
+            return self.embedding_function.embed_query(query)
+
+        future = _embed_executor.submit(embed)
+        # The timeout starts once the call runs: waiting for a free thread under
+        # load is not the embedding API being slow
+        started.wait()
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            return None
+
+    def retrieve(self, query, k=5, trace=None):
+        """Searches the keyword index and the vector store and fuses the rankings.
+
+        Returns (results, query_embedding, stats); the embedding is handed back
+        so the answer cache can use it without a second embedding call. It is
+        None when the keyword index answered alone, which stats["mode"] reports
+        as "lexical" (otherwise "hybrid" or "vector"). Each stage is recorded
+        as a separate span on `trace`.
+        """
+        trace = trace or Trace("retrieve")
+        start_time = time.time()
+        with trace.span("open", collection=self.collection_name) as span:
+            db, cold = self.get_db()
+            span["cold"] = cold
+        bm25 = self.bm25
+        lexical = []
+        confident = False
+        if bm25 is not None:
+            with trace.span("lexical", k=k) as span:
+                lexical = bm25.search(query, k=k * CANDIDATES_PER_RESULT)
+                confident = bm25.is_confident(query, lexical)
+                span["results"] = len(lexical)
+                span["confident"] = confident
+
+        query_embedding = None
+        if not confident:
+            with trace.span("embed", query_chars=len(query)) as span:
+                # Only worth waiting on a timeout when there is something to fall back to
+                query_embedding = self._embed_query(query, EMBED_TIMEOUT_SECONDS if lexical else None)
+                span["timed_out"] = query_embedding is None
+
+        if query_embedding is None:
+            mode = "lexical"
+            results = [(bm25.document(index), score) for index, score in lexical[:k]]
+        elif not lexical:
+            mode = "vector"
+            with trace.span("search", k=k) as span:
+                results = db.similarity_search_by_vector_with_relevance_scores(query_embedding, k=k)
+                span["results"] = len(results)
+        else:
+            mode = "hybrid"
+            with trace.span("search", k=k * CANDIDATES_PER_RESULT) as span:
+                vector_results = db.similarity_search_by_vector_with_relevance_scores(
+                    query_embedding, k=k * CANDIDATES_PER_RESULT
+                )
+                span["results"] = len(vector_results)
+            with trace.span("fuse") as span:
+                documents = {bm25.ids[index]: bm25.document(index) for index, _score in lexical}
+                documents.update({doc.id: doc for doc, _score in vector_results})
+                fused = reciprocal_rank_fusion([
+                    [doc.id for doc, _score in vector_results],
+                    [bm25.ids[index] for index, _score in lexical],
+                ])
+                results = [(documents[doc_id], score) for doc_id, score in fused[:k]]
+                span["results"] = len(results)
+
+        elapsed = time.time() - start_time
+        if self.track_last_used:
+            self._touch(db)
+        with self._lock:
+            if cold:
+                self.cold_queries += 1
+            else:
+                self.warm_queries += 1
+                self.warm_time_total += elapsed
+        return results, query_embedding, {"cold": cold, "open_time": self.open_time if cold else 0.0, "mode": mode}
+
+    def invalidate(self):
+        """Drops the open store so the next query reopens it (e.g. after an upload)."""
+        with self._lock:
+            self._db = None
+            self.bm25 = None
+            self.faq_answers = None
+        self.answer_cache.clear()
+
+    def stats(self):
+        """Cold open time and average warm query time, for logging and the UI."""
+        with self._lock:
+            warm_avg = self.warm_time_total / self.warm_queries if self.warm_queries else None
+            embedding_function = self.embedding_function
+        return {
+            "open_time": self.open_time,
+            "cold_queries": self.cold_queries,
+            "warm_queries": self.warm_queries,
+            "warm_avg_time": warm_avg,
+            "embedding_cache": embedding_function.stats() if hasattr(embedding_function, "stats") else None,
+            "answer_cache": self.answer_cache.stats(),
+        }
+
+
+_retrievers = {}
+_retrievers_lock = threading.Lock()
+
+
+def get_shared_retriever(chroma_path, api_key, embedding_provider=None, collection_name=DEFAULT_COLLECTION):
+    """Returns the process-wide retriever for a Chroma collection, creating it once."""
+    embedding_provider = embedding_provider or get_embedding_provider()
+    key = (os.path.abspath(chroma_path), embedding_provider.key, collection_name)
+    with _retrievers_lock:
+        retriever = _retrievers.get(key)
+        if retriever is None:
+            retriever = SharedRetriever(chroma_path, api_key, embedding_provider, collection_name)
+            _retrievers[key] = retriever
+        return retriever
+
+
+def invalidate_shared_retriever(chroma_path, collection_name=None):
+    """Invalidates the shared retrievers for one collection (or all of them) in a directory."""
+    path = os.path.abspath(chroma_path)
+    with _retrievers_lock:
+        retrievers = [
+            r for (p, _provider, name), r in _retrievers.items()
+            if p == path and collection_name in (None, name)
+        ]
+    for retriever in retrievers:
+        retriever.invalidate()
+
+
+def delete_collection(chroma_path, collection_name, client=None):
+    """Deletes a collection along with its shared retriever and the files kept next to it."""
+    if client is None:
+        client = Chroma(persist_directory=chroma_path)._client
+    try:
+        client.delete_collection(collection_name)
+    except Exception as e:
+        # Already gone (e.g. removed by TTL cleanup in another session)
+        print(f"Could not delete collection {collection_name}: {e}")
+    path = os.path.abspath(chroma_path)
+    with _retrievers_lock:
+        for key in [key for key in _retrievers if key[0] == path and key[2] == collection_name]:
+            _retrievers.pop(key).invalidate()
+    markers = (
+        _version_path(chroma_path, collection_name),
+        bm25_path(chroma_path, collection_name),
+        faq_path(chroma_path, collection_name),
+        upload_status_path(chroma_path, collection_name),
+    )
+    for marker in markers:
+        try:
+            os.remove(marker)
+        except OSError:
+            pass
+    remove_vector_store(chroma_path, collection_name)
+
+
+_last_cleanup = 0.0
+_cleanup_lock = threading.Lock()
+
+
+def cleanup_expired_collections(chroma_path, ttl=SESSION_TTL_SECONDS, min_interval=600):
+    """Deletes session collections nobody has queried for `ttl` seconds.
+
+    Cheap enough to call on every new session: it only scans the collection
+    list once every `min_interval` seconds per process. Returns the names
+    of the deleted collections.
+    """
+    global _last_cleanup
+    with _cleanup_lock:
+        now = time.time()
+        if now - _last_cleanup < min_interval:
+            return []
+        _last_cleanup = now
+
+    client = Chroma(persist_directory=chroma_path)._client
+    deleted = []
+    for collection in client.list_collections():
+        # Older chromadb versions return names, newer ones Collection objects
+        name = getattr(collection, "name", collection)
+        if not name.startswith(SESSION_COLLECTION_PREFIX):
+            continue
+        metadata = client.get_collection(name).metadata or {}
+        if now - metadata.get("last_used", 0) < ttl:
+            continue
+        delete_collection(chroma_path, name, client)
+        deleted.append(name)
+    # Status files of uploads that failed before their collection was created
+    for path in glob.glob(upload_status_path(chroma_path, f"{SESSION_COLLECTION_PREFIX}*")):
+        try:
+            if now - os.path.getmtime(path) >= ttl:
+                os.remove(path)
+        except OSError:
+            pass  # Removed by another process meanwhile
+    if deleted:
+        print(f"Removed {len(deleted)} expired session collections from {chroma_path}")
+    return deleted
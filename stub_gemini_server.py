@@ -0,0 +1,181 @@
+"""Local stand-in for the Gemini REST API, for testing without quota.
+
+Serves generateContent, streamGenerateContent (SSE), embedContent and
+batchEmbedContents with configurable latency and injected 429/503 errors.
+Point the app, populatedb.py, batch_qa.py or benchmark runs at it with
+GEMINI_BASE_URL:
+
+    python stub_gemini_server.py --port 8765 --latency 0.5 --error-rate 0.1
+    GEMINI_BASE_URL=http://127.0.0.1:8765 GEMINI_API_KEY=stub streamlit run app.py
+
+GET /stats returns how many requests of each kind were served, e.g. to
+check that concurrent identical questions were coalesced into one call.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from embedding_providers import HashingEmbeddings
+
+_PATH_RE = re.compile(r"^/[^/]+/(?:models/)?(?P<model>[^:/]+):(?P<method>\w+)")
+
+
+class StubGemini:
+    """Behaviour and counters shared by all request handlers."""
+
+    def __init__(self, latency=0.0, error_rate=0.0, chunks=5, dim=768, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.chunks = chunks
+        self.embeddings = HashingEmbeddings(dim)
+        self.random = random.Random(seed)
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def should_fail(self):
+        with self._lock:
+            return self.random.random() < self.error_rate
+
+    def answer(self, body):
+        prompt = "".join(
+            part.get("text", "") for content in body.get("contents", []) for part in content.get("parts", [])
+        )
+        # Gemini counts the system instruction as prompt tokens too
+        system = "".join(part.get("text", "") for part in (body.get("systemInstruction") or {}).get("parts", []))
+        question = prompt.strip().splitlines()[-1] if prompt.strip() else ""
+        return f"Stub answer to: {question[-200:]}", (len(system) + len(prompt)) // 4
+
+
+def _response(text, prompt_tokens, model, final=True, output_tokens=None):
+    response = {
+        "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}],
+        "modelVersion": model,
+    }
+    if final:
+        response["candidates"][0]["finishReason"] = "STOP"
+        if output_tokens is None:
+            output_tokens = len(text) // 4
+        response["usageMetadata"] = {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": output_tokens,
+            "totalTokenCount": prompt_tokens + output_tokens,
+        }
+    return response
+
+
+def make_handler(stub):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive, so connection reuse shows up like upstream
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/stats":
+                with stub._lock:
+                    self._send_json(200, dict(stub.counts))
+            else:
+                self._send_json(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            match = _PATH_RE.match(self.path)
+            if not match:
+                self._send_json(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+                return
+            model, method = match.group("model"), match.group("method")
+            stub.count(method)
+            time.sleep(stub.latency)
+            if stub.should_fail():
+                stub.count("injected_errors")
+                code, status = stub.random.choice([(429, "RESOURCE_EXHAUSTED"), (503, "UNAVAILABLE")])
+                self._send_json(code, {"error": {"code": code, "message": "Injected by stub", "status": status}})
+                return
+
+            if method == "generateContent":
+                text, prompt_tokens = stub.answer(body)
+                self._send_json(200, _response(text, prompt_tokens, model))
+            elif method == "streamGenerateContent":
+                self._stream(body, model)
+            elif method == "embedContent":
+                text = "".join(part.get("text", "") for part in body.get("content", {}).get("parts", []))
+                self._send_json(200, {"embedding": {"values": stub.embeddings.embed_query(text)}})
+            elif method == "batchEmbedContents":
+                texts = [
+                    "".join(part.get("text", "") for part in request.get("content", {}).get("parts", []))
+                    for request in body.get("requests", [])
+                ]
+                vectors = stub.embeddings.embed_documents(texts)
+                self._send_json(200, {"embeddings": [{"values": vector} for vector in vectors]})
+            else:
+                self._send_json(400, {"error": {"code": 400, "message": f"Unsupported method {method}",
+                                                "status": "INVALID_ARGUMENT"}})
+
+        def _stream(self, body, model):
+            text, prompt_tokens = stub.answer(body)
+            step = max(1, len(text) // stub.chunks)
+            pieces = [text[start:start + step] for start in range(0, len(text), step)]
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for index, piece in enumerate(pieces):
+                if index:
+                    time.sleep(stub.latency / stub.chunks)
+                # The final chunk reports usage for the whole answer, like Gemini
+                payload = _response(piece, prompt_tokens, model, index == len(pieces) - 1, len(text) // 4)
+                event = f"data: {json.dumps(payload)}\r\n\r\n"
+                data = event.encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_stub_server(port=0, host="127.0.0.1", **options):
+    """Starts the stub in a daemon thread; returns (server, stub). Port 0 picks a free port."""
+    stub = StubGemini(**options)
+    server = ThreadingHTTPServer((host, port), make_handler(stub))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="stub-gemini").start()
+    return server, stub
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a stub Gemini API for local testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before each response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 429/503")
+    parser.add_argument("--chunks", type=int, default=5, help="Chunks per streamed answer")
+    parser.add_argument("--dim", type=int, default=768, help="Embedding dimension")
+    args = parser.parse_args()
+
+    server, _stub = start_stub_server(
+        args.port, args.host, latency=args.latency, error_rate=args.error_rate, chunks=args.chunks, dim=args.dim
+    )
+    print(f"Stub Gemini API on http://{args.host}:{server.server_address[1]} "
+          f"(latency {args.latency}s, error rate {args.error_rate:.0%}); Ctrl+C to stop")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
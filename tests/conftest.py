@@ -0,0 +1,12 @@
+import os
+import sys
+
+# Same sqlite swap as the entry points, for chromadb on older system sqlite
+try:
+    __import__('pysqlite3')
+    sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
+except ImportError:
+    pass
+
+# The modules live at the top of the repo
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
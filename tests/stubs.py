@@ -0,0 +1,67 @@
+"""Stub Gemini client and retriever shared by the tests; nothing here touches the network."""
+import time
+
+from langchain_core.documents import Document
+
+from embedding_providers import get_embedding_provider
+from rag_bot import EventAssistantRAGBot
+
+CHUNKS = ["The keynote ", "starts at ", "10:00 AM ", "in Hall A."]
+FIRST_CHUNK_DELAY = 0.05
+
+
+class _Response:
+    def __init__(self, text):
+        self.text = text
+        self.usage_metadata = None
+
+
+class _StubModels:
+    def __init__(self):
+        self.calls = []
+
+    def generate_content(self, *, model, contents, config=None):
+        self.calls.append("generate_content")
+        return _Response("".join(CHUNKS))
+
+    def generate_content_stream(self, *, model, contents, config=None):
+        self.calls.append("generate_content_stream")
+        time.sleep(FIRST_CHUNK_DELAY)
+        yield _Response(None)  # Gemini can send chunks without text; they are not a first token
+        for text in CHUNKS:
+            yield _Response(text)
+            time.sleep(0.01)
+
+
+class StubClient:
+    def __init__(self):
+        self.models = _StubModels()
+
+
+class _NoAnswerCache:
+    def lookup(self, *args):
+        return None
+
+    def store(self, *args):
+        pass
+
+
+class StubRetriever:
+    """Returns one fixed chunk, as the shared retriever would."""
+
+    version = "1"
+    answer_cache = _NoAnswerCache()
+
+    def retrieve(self, query, k=5, trace=None):
+        doc = Document(id="c1", page_content="Keynote: 10:00 AM, Hall A.", metadata={"source": "event.pdf", "start_index": 0})
+        return [(doc, 0.9)], [0.1, 0.2], {"cold": False, "open_time": 0.0, "mode": "vector"}
+
+    def faq_answer(self, intent):
+        return None
+
+
+def make_bot(tmp_path):
+    client = StubClient()
+    bot = EventAssistantRAGBot("test", str(tmp_path), client=client, embedding_provider=get_embedding_provider("local"))
+    bot.retriever = StubRetriever()
+    return bot, client
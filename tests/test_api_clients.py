@@ -0,0 +1,152 @@
+"""Coalescing, retries and abandoned streams in the pooled Gemini client, against a stub models object."""
+import threading
+import time
+
+import pytest
+
+import api_clients
+from api_clients import PooledModels, SingleFlight
+
+CHUNKS = ["Lunch ", "is at ", "1:00 PM."]
+
+
+class Unavailable(Exception):
+    code = 503
+
+
+class BadRequest(Exception):
+    code = 400
+
+
+class StubModels:
+    """Counts upstream calls. Streams wait for `release` after the first chunk."""
+
+    def __init__(self, failures=()):
+        self.calls = 0
+        self.failures = list(failures)  # Raised by the first calls, in order
+        self.release = threading.Event()
+        self.closed = threading.Event()
+
+    def _maybe_fail(self):
+        self.calls += 1
+        if self.failures:
+            raise self.failures.pop(0)
+
+    def generate_content(self, *, model, contents, config=None):
+        self._maybe_fail()
+        time.sleep(0.05)  # Long enough for concurrent callers to join
+        return "".join(CHUNKS)
+
+    def generate_content_stream(self, *, model, contents, config=None):
+        self._maybe_fail()
+        try:
+            yield CHUNKS[0]
+            self.release.wait(5)
+            yield from CHUNKS[1:]
+        finally:
+            self.closed.set()
+
+
+@pytest.fixture(autouse=True)
+def fresh_flights(monkeypatch):
+    monkeypatch.setattr(api_clients, "_flights", SingleFlight())
+    monkeypatch.setattr(api_clients, "backoff_delay", lambda attempt: 0)
+    return api_clients._flights
+
+
+def run_in_threads(count, fn):
+    results = [None] * count
+
+    def run(i):
+        try:
+            results[i] = fn()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert condition()
+
+
+def test_identical_calls_share_one_upstream_call(fresh_flights):
+    stub = StubModels()
+    models = PooledModels(stub)
+    threads, results = run_in_threads(
+        5, lambda: models.generate_content(model="m", contents="When is lunch?")
+    )
+    for thread in threads:
+        thread.join(5)
+
+    assert results == ["".join(CHUNKS)] * 5
+    assert stub.calls == 1
+    assert (fresh_flights.leaders, fresh_flights.followers) == (1, 4)
+
+
+def test_identical_streams_are_replayed_to_every_caller(fresh_flights):
+    stub = StubModels()
+    models = PooledModels(stub)
+    threads, results = run_in_threads(
+        4, lambda: list(models.generate_content_stream(model="m", contents="When is lunch?"))
+    )
+    wait_for(lambda: fresh_flights.leaders + fresh_flights.followers == 4)
+    stub.release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == [CHUNKS] * 4
+    assert stub.calls == 1
+
+
+def test_retryable_errors_are_retried():
+    stub = StubModels(failures=[Unavailable("503"), Unavailable("503")])
+    assert PooledModels(stub).generate_content(model="m", contents="q") == "".join(CHUNKS)
+    assert stub.calls == 3
+
+
+def test_other_errors_are_not_retried():
+    stub = StubModels(failures=[BadRequest("400")])
+    with pytest.raises(BadRequest):
+        PooledModels(stub).generate_content(model="m", contents="q")
+    assert stub.calls == 1
+
+
+def test_followers_finish_when_the_leader_stops_reading(fresh_flights):
+    stub = StubModels()
+    models = PooledModels(stub)
+    leader = models.generate_content_stream(model="m", contents="When is lunch?")
+    assert next(leader) == CHUNKS[0]
+    threads, results = run_in_threads(
+        3, lambda: list(models.generate_content_stream(model="m", contents="When is lunch?"))
+    )
+    wait_for(lambda: fresh_flights.followers == 3)
+
+    # What Streamlit's rerun does to the leader's generator
+    leader.close()
+    stub.release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == [CHUNKS] * 3
+    assert stub.calls == 1
+
+
+def test_abandoned_stream_without_followers_is_closed(fresh_flights):
+    stub = StubModels()
+    models = PooledModels(stub)
+    leader = models.generate_content_stream(model="m", contents="When is lunch?")
+    next(leader)
+    leader.close()
+
+    assert stub.closed.wait(1)
+    # The next identical call starts a new upstream call instead of joining the dead one
+    stub.release.set()
+    assert list(models.generate_content_stream(model="m", contents="When is lunch?")) == CHUNKS
+    assert stub.calls == 2
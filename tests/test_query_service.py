@@ -0,0 +1,130 @@
+"""query_service.py served in-process on a free port, answering through the stub bot."""
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+from embedding_providers import get_embedding_provider
+from query_client import RemoteRAGBot
+from query_service import QueryService
+from retriever import bump_collection_version
+from stubs import CHUNKS, make_bot
+
+
+class StubQueryService(QueryService):
+    """Answers with the stub bot; with a gate, every answer waits until it is set."""
+
+    def __init__(self, chroma_path, max_pending=8, gate=None):
+        super().__init__(chroma_path, "test", workers=2, max_pending=max_pending,
+                         embedding_provider=get_embedding_provider("local"))
+        self.gate = gate
+        self.collections = []
+
+    def make_bot(self, template_type, collection_name):
+        self.collections.append(collection_name)
+        bot, _client = make_bot(self.chroma_path)
+        if self.gate is not None:
+            answer_question = bot.answer_question
+
+            def gated_answer_question(*args, **kwargs):
+                self.gate.wait(5)
+                return answer_question(*args, **kwargs)
+
+            bot.answer_question = gated_answer_question
+        return bot
+
+
+@pytest.fixture
+def serve():
+    """Starts a service on an event loop thread; yields its base URL."""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    servers = []
+
+    def start(service):
+        server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(service.handle_connection, "127.0.0.1", 0), loop
+        ).result()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+
+    yield start
+
+    async def shut_down():
+        for server in servers:
+            server.close()
+        # Keep-alive connections from the shared HTTP client are still being served
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run_coroutine_threadsafe(shut_down(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
+
+
+def test_streamed_answer(tmp_path, serve):
+    base_url = serve(StubQueryService(str(tmp_path)))
+    seen = []
+    statuses = []
+    response = RemoteRAGBot(base_url).answer_question(
+        "When does the keynote start?", on_token=seen.append, on_status=statuses.append
+    )
+
+    assert seen == ["".join(CHUNKS[:i + 1]) for i in range(len(CHUNKS))]
+    assert statuses == ["Retrieving relevant information...", "Generating response..."]
+    assert response["text"] == "".join(CHUNKS)
+    assert response["first_token_time"] is not None
+    assert response["service"]["queue_seconds"] >= 0
+
+
+def test_answer_without_streaming(tmp_path, serve):
+    service = StubQueryService(str(tmp_path))
+    base_url = serve(service)
+    response = RemoteRAGBot(base_url).answer_question("When does the keynote start?")
+
+    assert response["text"] == "".join(CHUNKS)
+    assert response["first_token_time"] is None
+    assert service.collections == ["langchain"]
+
+
+def test_busy_service_returns_503(tmp_path, serve):
+    gate = threading.Event()
+    service = StubQueryService(str(tmp_path), max_pending=1, gate=gate)
+    base_url = serve(service)
+    first = {}
+    thread = threading.Thread(
+        target=lambda: first.update(RemoteRAGBot(base_url).answer_question("When does the keynote start?"))
+    )
+    thread.start()
+    try:
+        deadline = time.monotonic() + 5
+        while service.pending < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        busy = httpx.post(f"{base_url}/answer", json={"question": "Lunch kab hai?"})
+        assert busy.status_code == 503
+    finally:
+        gate.set()
+        thread.join(5)
+    assert first["text"] == "".join(CHUNKS)
+
+
+def test_only_known_collections_are_answered(tmp_path, serve):
+    service = StubQueryService(str(tmp_path))
+    base_url = serve(service)
+    bump_collection_version(str(tmp_path), "session_abc123_0123456789ab")
+
+    for name in ("session_nobody_0123456789ab", "other", "../langchain"):
+        response = httpx.post(f"{base_url}/answer", json={"question": "Lunch kab hai?", "collection": name})
+        assert response.status_code == 404
+    response = httpx.post(
+        f"{base_url}/answer", json={"question": "Lunch kab hai?", "collection": "session_abc123_0123456789ab"}
+    )
+    assert response.status_code == 200
+    # Rejected names never reached a bot, so no collection was opened or created for them
+    assert service.collections == ["session_abc123_0123456789ab"]
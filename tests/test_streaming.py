@@ -0,0 +1,36 @@
+"""answer_question with on_token, against a local stub that streams chunks."""
+from stubs import CHUNKS, FIRST_CHUNK_DELAY, make_bot
+
+
+def test_streaming_accumulates_tokens(tmp_path):
+    bot, client = make_bot(tmp_path)
+    seen = []
+    statuses = []
+    response = bot.answer_question("When does the keynote start?", on_token=seen.append, on_status=statuses.append)
+
+    assert client.models.calls == ["generate_content_stream"]
+    # One callback per chunk with text, each with everything received so far
+    assert seen == ["".join(CHUNKS[:i + 1]) for i in range(len(CHUNKS))]
+    assert response["text"] == "".join(CHUNKS)
+    assert statuses == ["Retrieving relevant information...", "Generating response..."]
+
+
+def test_streaming_records_first_token_time(tmp_path):
+    bot, _client = make_bot(tmp_path)
+    response = bot.answer_question("When does the keynote start?", on_token=lambda text: None)
+
+    assert response["first_token_time"] >= FIRST_CHUNK_DELAY
+    assert response["first_token_time"] <= response["llm_time"]
+    llm_span = next(span for span in response["trace"]["spans"] if span["name"] == "llm")
+    assert llm_span["attributes"]["streamed"] is True
+    assert llm_span["attributes"]["first_token_time"] == response["first_token_time"]
+
+
+def test_without_on_token_falls_back_to_one_call(tmp_path):
+    bot, client = make_bot(tmp_path)
+    response = bot.answer_question("When does the keynote start?")
+
+    assert client.models.calls == ["generate_content"]
+    assert response["text"] == "".join(CHUNKS)
+    assert response["first_token_time"] is None
+    assert response["llm_time"] is not None
@@ -0,0 +1,170 @@
+"""Per-stage tracing and metrics for the RAG pipeline.
+
+Every question gets a Trace made of spans (embed, search, context join,
+prompt format, LLM call, post-processing), each with its duration and a few
+attributes such as k, context characters and prompt tokens. Finished traces
+are folded into process-wide histograms, which can be read from a small
+local HTTP endpoint (METRICS_PORT) and/or appended as JSON lines to
+TRACE_LOG_PATH for offline analysis of p99 spikes and regressions.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH")
+METRICS_PORT = os.getenv("METRICS_PORT")
+# Upper bounds in seconds; the last bucket catches everything slower
+HISTOGRAM_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+RECENT_SAMPLES = 2000  # Kept per span for percentile estimates
+
+
+class Trace:
+    """Spans recorded while answering one question."""
+
+    def __init__(self, name="answer_question", **attributes):
+        self.name = name
+        self.attributes = dict(attributes)
+        self.spans = []
+        self.start = time.perf_counter()
+        self.duration = None
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Times the enclosed block; yields a dict the block can add attributes to."""
+        record = {"name": name, "attributes": dict(attributes)}
+        start = time.perf_counter()
+        try:
+            yield record["attributes"]
+        except Exception as e:
+            record["attributes"]["error"] = type(e).__name__
+            raise
+        finally:
+            record["duration"] = time.perf_counter() - start
+            self.spans.append(record)
+
+    def duration_of(self, *names):
+        """Total seconds spent in spans with the given names."""
+        return sum(span["duration"] for span in self.spans if span["name"] in names)
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.start
+        return self
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "timestamp": time.time(),
+            "duration": self.duration,
+            "attributes": self.attributes,
+            "spans": self.spans,
+        }
+
+
+class Histogram:
+    """Bucketed latency histogram plus a window of recent samples for percentiles."""
+
+    def __init__(self):
+        self.counts = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(HISTOGRAM_BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.recent.append(value)
+
+    def summary(self):
+        p50 = p95 = p99 = None
+        if self.recent:
+            p50, p95, p99 = (float(v) for v in np.percentile(list(self.recent), [50, 95, 99]))
+        labels = [str(bound) for bound in HISTOGRAM_BUCKETS] + ["+Inf"]
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "p50": p50,
+            "p95": p95,
+            "p99": p99,
+            "max": self.max,
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class Tracer:
+    """Aggregates finished traces into per-span histograms."""
+
+    def __init__(self, log_path=TRACE_LOG_PATH):
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def record(self, trace):
+        trace.finish()
+        with self._lock:
+            self._histograms.setdefault(trace.name, Histogram()).observe(trace.duration)
+            for span in trace.spans:
+                self._histograms.setdefault(span["name"], Histogram()).observe(span["duration"])
+            if self.log_path:
+                with open(self.log_path, "a") as file:
+                    file.write(json.dumps(trace.to_dict(), default=str) + "\n")
+
+    def observe(self, name, seconds):
+        """Adds one measurement that wasn't timed as a span, e.g. how long imports took."""
+        with self._lock:
+            self._histograms.setdefault(name, Histogram()).observe(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: histogram.summary() for name, histogram in self._histograms.items()}
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+
+
+tracer = Tracer()
+
+_metrics_server = None
+_metrics_server_lock = threading.Lock()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = json.dumps(tracer.snapshot(), indent=2).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep scrapes out of the app's console
+
+
+def start_metrics_server(port=METRICS_PORT, host="127.0.0.1"):
+    """Serves the histograms as JSON on http://host:port/metrics, once per process.
+
+    Does nothing when no port is configured.
+    """
+    global _metrics_server
+    if not port:
+        return None
+    with _metrics_server_lock:
+        if _metrics_server is None:
+            _metrics_server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+            threading.Thread(target=_metrics_server.serve_forever, daemon=True, name="metrics").start()
+            print(f"Serving RAG metrics on http://{host}:{port}/metrics")
+        return _metrics_server
@@ -0,0 +1,190 @@
+"""Indexing of files uploaded through the chat UI.
+
+Each session's upload goes into its own Chroma collection, chunked exactly
+like populatedb.py chunks the event PDFs and embedded in batches, so a large
+file retrieves well and one user's upload never touches another's context.
+
+Uploads are identified by a hash of their bytes and indexed by a background
+job into a fresh collection. The session keeps answering from its previous
+collection until the job is done and the UI switches the bot over.
+"""
+import io
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_chroma import Chroma
+
+from bm25_index import build_bm25_index
+from populatedb import split_pages, store_chunks
+from retriever import (
+    bump_collection_version, get_shared_retriever, invalidate_shared_retriever, session_collection_name,
+    upload_status_path
+)
+
+UPLOAD_WORKERS = 2  # Uploads indexed at the same time across all sessions
+
+_executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="upload")
+
+
+def iter_upload_pages(data, filename, on_page=None):
+    """Yields (page_number, text) for an uploaded PDF, TXT or DOCX file's bytes.
+
+    PDFs are read one page at a time; TXT and DOCX files are a single page
+    without a number. on_page, if given, is called with (pages read, page
+    count) as each page is handed out.
+    """
+    filename = filename.lower()
+    if filename.endswith(".pdf"):
+        # Imported on first use, like docx below, to keep the app's startup imports light
+        import PyPDF2
+        reader = PyPDF2.PdfReader(io.BytesIO(data))
+        page_count = len(reader.pages)
+        for page_num, page in enumerate(reader.pages):
+            text = page.extract_text() or ""
+            if on_page is not None:
+                on_page(page_num + 1, page_count)
+            yield page_num + 1, text
+        return
+    if filename.endswith(".txt"):
+        text = data.decode("utf-8")
+    elif filename.endswith(".docx"):
+        import docx
+        doc = docx.Document(io.BytesIO(data))
+        text = "\n".join([para.text for para in doc.paragraphs])
+    else:
+        raise ValueError(f"Unsupported file type: {filename}")
+    if on_page is not None:
+        on_page(1, 1)
+    yield None, text
+
+
+def index_uploaded_pages(chroma_path, api_key, collection_name, pages, source, on_progress=None,
+                         embedding_provider=None):
+    """Replaces the given upload collection with the chunks of one file's pages.
+
+    The pages are chunked as embedding goes, so a long PDF is never held as
+    one list of chunks. Returns the number of chunks stored.
+    """
+    chunks = split_pages(pages, {"source": source})
+    first_chunk = next(chunks, None)
+    if first_chunk is None:
+        raise ValueError("No text could be extracted from the file.")
+    chunks = itertools.chain([first_chunk], chunks)
+    retriever = get_shared_retriever(chroma_path, api_key, embedding_provider, collection_name=collection_name)
+    embedding_function = retriever.get_embedding_function()
+
+    # Start from an empty collection in case an earlier attempt left chunks behind
+    db = Chroma(collection_name=collection_name, persist_directory=chroma_path, embedding_function=embedding_function)
+    db.delete_collection()
+    db = Chroma(
+        collection_name=collection_name,
+        persist_directory=chroma_path,
+        embedding_function=embedding_function,
+        collection_metadata={"last_used": time.time(), **retriever.embedding_provider.metadata()}
+    )
+
+    num_chunks = store_chunks(db, chunks, embedding_function, on_progress=on_progress)
+    build_bm25_index(db, chroma_path, collection_name)
+
+    # Sessions querying this collection reopen it and forget cached answers
+    bump_collection_version(chroma_path, collection_name)
+    invalidate_shared_retriever(chroma_path, collection_name)
+    return num_chunks
+
+
+class UploadJob:
+    """Progress and result of one background upload indexing run."""
+
+    def __init__(self, filename, content_hash, collection_name, status_path=None):
+        self.filename = filename
+        self.content_hash = content_hash
+        self.collection_name = collection_name
+        self.progress = 0.0
+        self.message = "Waiting to start..."
+        self.num_chunks = 0
+        self.pages_read = 0
+        self.page_count = 0
+        self.error = None
+        # If set, status() is also written here, e.g. for other query service processes
+        self.status_path = status_path
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def status(self):
+        return {
+            "collection": self.collection_name,
+            "filename": self.filename,
+            "content_hash": self.content_hash,
+            "progress": self.progress,
+            "message": self.message,
+            "num_chunks": self.num_chunks,
+            "error": self.error,
+            "done": self.done,
+        }
+
+    def _save_status(self):
+        if self.status_path is None:
+            return
+        with open(self.status_path + ".tmp", "w") as file:
+            json.dump(self.status(), file)
+        os.replace(self.status_path + ".tmp", self.status_path)
+
+    def _page_read(self, pages_read, page_count):
+        self.pages_read = pages_read
+        self.page_count = page_count
+
+    def _update(self, stored, total):
+        # The chunk total isn't known while pages are still being read, so
+        # progress follows the pages: opening the file is the first 10%
+        self.progress = 0.1 + 0.85 * self.pages_read / max(self.page_count, 1)
+        pages = f", page {self.pages_read}/{self.page_count}" if self.page_count > 1 else ""
+        self.message = f"Indexing {self.filename}: {stored} chunks stored{pages}"
+        self._save_status()
+
+    def _run(self, chroma_path, api_key, data, embedding_provider=None):
+        try:
+            self.message = f"Reading {self.filename}..."
+            pages = iter_upload_pages(data, self.filename, on_page=self._page_read)
+            self.num_chunks = index_uploaded_pages(
+                chroma_path, api_key, self.collection_name, pages, self.filename, on_progress=self._update,
+                embedding_provider=embedding_provider
+            )
+            self.progress = 1.0
+            self.message = f"Indexed {self.filename} ({self.num_chunks} chunks)"
+        except Exception as e:
+            self.error = str(e)
+            self.message = f"Could not index {self.filename}: {e}"
+        finally:
+            self._done.set()
+            self._save_status()
+
+
+def start_upload_job(chroma_path, api_key, session_id, data, filename, content_hash, save_status=False,
+                     embedding_provider=None):
+    """Starts indexing an upload in the background and returns its UploadJob.
+
+    With save_status the job's progress is also kept in a file next to the
+    collection, where read_upload_status finds it from any process.
+    """
+    collection_name = session_collection_name(session_id, content_hash)
+    status_path = upload_status_path(chroma_path, collection_name) if save_status else None
+    job = UploadJob(filename, content_hash, collection_name, status_path)
+    job._save_status()
+    _executor.submit(job._run, chroma_path, api_key, data, embedding_provider)
+    return job
+
+
+def read_upload_status(chroma_path, collection_name):
+    """The last status saved by an upload job for this collection, or None."""
+    try:
+        with open(upload_status_path(chroma_path, collection_name)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
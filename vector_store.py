@@ -0,0 +1,342 @@
+"""Memory-mapped vector store, an alternative to Chroma for small and medium corpora.
+
+`python populatedb.py --export-mmap` copies the Chroma collection into a
+directory next to it (mmap.<collection>/):
+
+- vectors.npy: unit-length embeddings as int8 with a per-row scale in
+  scales.npy, or as float16. Opened with mmap, so startup reads almost
+  nothing. int8 is the default: it is half the size and scores several
+  times faster, because NumPy converts float16 slowly.
+- texts.bin and records.bin with their offset arrays: chunk texts and
+  {"id", "metadata"} records, decoded only for the hits of a query.
+- header.json: count, dimension, dtype and the embedding backend.
+- ivf_*.npy: an inverted-file index (k-means lists), only for stores with
+  more than ANN_MIN_VECTORS vectors. The vectors are then stored list by
+  list, so probing a list reads one contiguous slice.
+
+Small stores are searched exactly with blocked matrix products. Larger ones
+score the IVF_NPROBE lists whose centroids are closest to the query and then
+only the vectors in those lists. Relevance scores are cosine similarities.
+
+Set VECTOR_STORE=mmap to have the app query the export instead of Chroma.
+populatedb.py removes the export whenever the collection changes without
+re-exporting it, so an export on disk always matches the Chroma data.
+"""
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+
+VECTOR_STORE = os.getenv("VECTOR_STORE", "chroma")  # "chroma" or "mmap"
+VECTOR_STORE_DTYPE = os.getenv("VECTOR_STORE_DTYPE", "int8")  # "int8" or "float16"
+ANN_MIN_VECTORS = int(os.getenv("ANN_MIN_VECTORS", "5000"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+IVF_TRAIN_ITERATIONS = 10
+IVF_SAMPLES_PER_LIST = 64
+SEARCH_BLOCK_ROWS = 16384  # Rows converted to float32 at a time during exact search
+EXPORT_BATCH_SIZE = 1000
+FORMAT_VERSION = 1
+DTYPES = ("int8", "float16")
+
+
+def vector_store_path(chroma_path, collection_name):
+    return os.path.join(chroma_path, f"mmap.{collection_name}")
+
+
+def remove_vector_store(chroma_path, collection_name):
+    """Deletes a collection's export, if there is one; returns whether there was."""
+    path = vector_store_path(chroma_path, collection_name)
+    if not os.path.isdir(path):
+        return False
+    shutil.rmtree(path)
+    return True
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def quantize(vectors, dtype):
+    """Returns (stored vectors, per-row scales or None) for float32 unit vectors."""
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+def dequantize(vectors, scales=None):
+    vectors = vectors.astype(np.float32)
+    if scales is not None:
+        vectors *= scales[:, None]
+    return vectors
+
+
+class _BlobWriter:
+    """Appends byte strings to one file and records where each one starts."""
+
+    def __init__(self, directory, name):
+        self.directory = directory
+        self.name = name
+        self.file = open(os.path.join(directory, f"{name}.bin"), "wb")
+        self.offsets = [0]
+
+    def add(self, data):
+        self.file.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+
+    def close(self):
+        self.file.close()
+        np.save(os.path.join(self.directory, f"{self.name}.offsets.npy"), np.array(self.offsets, dtype=np.int64))
+
+
+class _Blob:
+    """Read side of _BlobWriter: item i is sliced out of the memory-mapped file."""
+
+    def __init__(self, directory, name):
+        self.offsets = np.load(os.path.join(directory, f"{name}.offsets.npy"), mmap_mode="r")
+        path = os.path.join(directory, f"{name}.bin")
+        # Empty files can't be mapped
+        self.data = np.memmap(path, dtype=np.uint8, mode="r") if os.path.getsize(path) else np.zeros(0, np.uint8)
+
+    def __getitem__(self, index):
+        return self.data[self.offsets[index]:self.offsets[index + 1]].tobytes()
+
+
+def train_ivf(vectors, scales=None, num_lists=None, iterations=IVF_TRAIN_ITERATIONS, seed=0):
+    """Spherical k-means over a sample of the vectors; returns (centroids, order, offsets).
+
+    order lists the vector indexes grouped by list: list i holds
+    order[offsets[i]:offsets[i + 1]].
+    """
+    count = len(vectors)
+    num_lists = num_lists or max(1, int(np.sqrt(count)))
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(count, size=min(count, num_lists * IVF_SAMPLES_PER_LIST), replace=False))
+    data = dequantize(vectors[sample], scales[sample] if scales is not None else None)
+    centroids = data[rng.choice(len(data), size=num_lists, replace=False)]
+    for _ in range(iterations):
+        assignment = np.argmax(data @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        counts = np.bincount(assignment, minlength=num_lists)
+        nonempty = np.flatnonzero(counts)
+        # Sum the members of every nonempty list in one pass; empty lists keep their centroid
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[nonempty]
+        centroids[nonempty] = np.add.reduceat(data[order], starts, axis=0)
+        centroids = _normalize(centroids)
+
+    assignment = np.empty(count, dtype=np.int32)
+    for start in range(0, count, SEARCH_BLOCK_ROWS):
+        stop = min(start + SEARCH_BLOCK_ROWS, count)
+        block = dequantize(vectors[start:stop], scales[start:stop] if scales is not None else None)
+        assignment[start:stop] = np.argmax(block @ centroids.T, axis=1)
+    order = np.argsort(assignment, kind="stable").astype(np.int64)
+    offsets = np.searchsorted(assignment[order], np.arange(num_lists + 1)).astype(np.int64)
+    return centroids.astype(np.float32), order, offsets
+
+
+def _store_by_list(directory, name, order):
+    """Rewrites <name>.npy with its rows in IVF list order."""
+    path = os.path.join(directory, f"{name}.npy")
+    sorted_path = os.path.join(directory, f"{name}.sorted.npy")
+    rows = np.load(path, mmap_mode="r")
+    out = np.lib.format.open_memmap(sorted_path, mode="w+", dtype=rows.dtype, shape=(len(order),) + rows.shape[1:])
+    for start in range(0, len(order), SEARCH_BLOCK_ROWS):
+        out[start:start + SEARCH_BLOCK_ROWS] = rows[order[start:start + SEARCH_BLOCK_ROWS]]
+    out.flush()
+    del out, rows
+    os.replace(sorted_path, path)
+
+
+def export_vector_store(db, chroma_path, collection_name, dtype=VECTOR_STORE_DTYPE,
+                        batch_size=EXPORT_BATCH_SIZE, ann_min_vectors=ANN_MIN_VECTORS):
+    """Copies a Chroma collection into a memory-mapped store next to it.
+
+    The new store is written to a temporary directory and swapped in, so a
+    server that has the old one open keeps working. Returns the number of
+    vectors exported.
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"Unknown vector store dtype {dtype!r}; choose one of {', '.join(DTYPES)}")
+    start_time = time.time()
+    collection = db._collection
+    count = collection.count()
+    path = vector_store_path(chroma_path, collection_name)
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    texts = _BlobWriter(tmp_path, "texts")
+    records = _BlobWriter(tmp_path, "records")
+    vectors = scales = None
+    written = 0
+    while written < count:
+        batch = collection.get(
+            include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=written
+        )
+        if not batch["ids"]:
+            break
+        embeddings = _normalize(np.asarray(batch["embeddings"], dtype=np.float32))
+        if vectors is None:
+            vectors = np.lib.format.open_memmap(
+                os.path.join(tmp_path, "vectors.npy"), mode="w+", dtype=np.dtype(dtype),
+                shape=(count, embeddings.shape[1])
+            )
+            if dtype == "int8":
+                scales = np.lib.format.open_memmap(
+                    os.path.join(tmp_path, "scales.npy"), mode="w+", dtype=np.float32, shape=(count,)
+                )
+        stored, row_scales = quantize(embeddings, dtype)
+        vectors[written:written + len(stored)] = stored
+        if scales is not None:
+            scales[written:written + len(stored)] = row_scales
+        for doc_id, text, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"]):
+            texts.add((text or "").encode("utf-8"))
+            records.add(json.dumps({"id": doc_id, "metadata": metadata or {}}).encode("utf-8"))
+        written += len(batch["ids"])
+    texts.close()
+    records.close()
+
+    dimension = vectors.shape[1] if vectors is not None else None
+    if vectors is not None:
+        vectors.flush()
+        if scales is not None:
+            scales.flush()
+    del vectors, scales
+    ann = dimension is not None and written > ann_min_vectors
+    if ann:
+        vectors = np.load(os.path.join(tmp_path, "vectors.npy"), mmap_mode="r")
+        scales = np.load(os.path.join(tmp_path, "scales.npy"), mmap_mode="r") if dtype == "int8" else None
+        centroids, order, offsets = train_ivf(vectors[:written], scales[:written] if scales is not None else None)
+        del vectors, scales
+        np.save(os.path.join(tmp_path, "ivf_centroids.npy"), centroids)
+        np.save(os.path.join(tmp_path, "ivf_order.npy"), order)
+        np.save(os.path.join(tmp_path, "ivf_offsets.npy"), offsets)
+        _store_by_list(tmp_path, "vectors", order)
+        if dtype == "int8":
+            _store_by_list(tmp_path, "scales", order)
+
+    embedding = {key: value for key, value in (collection.metadata or {}).items() if key.startswith("embedding_")}
+    header = {
+        "format": FORMAT_VERSION,
+        "collection": collection_name,
+        "count": written,
+        "dimension": dimension,
+        "dtype": dtype,
+        "ann": "ivf" if ann else None,
+        "embedding": embedding,
+        "exported_at": time.time(),
+    }
+    with open(os.path.join(tmp_path, "header.json"), "w") as file:
+        json.dump(header, file, indent=2)
+
+    # Swap the directories; an open store keeps reading the old (unlinked) files
+    old_path = f"{path}.old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    print(f"Exported {written} vectors of collection {collection_name} to {path} "
+          f"({dtype}{', IVF index' if ann else ''}) in {time.time() - start_time:.2f}s")
+    return written
+
+
+class MmapVectorStore:
+    """Read-only store written by export_vector_store; safe to share between threads."""
+
+    def __init__(self, path, nprobe=IVF_NPROBE):
+        self.path = path
+        with open(os.path.join(path, "header.json")) as file:
+            self.header = json.load(file)
+        if self.header.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported vector store format in {path}; export it again")
+        self.count = self.header["count"]
+        self.dimension = self.header["dimension"]
+        self.dtype = self.header["dtype"]
+        self.metadata = self.header.get("embedding") or {}
+        self.nprobe = nprobe
+        self.vectors = None
+        self.scales = None
+        if self.count:
+            self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+            if self.dtype == "int8":
+                self.scales = np.load(os.path.join(path, "scales.npy"), mmap_mode="r")
+        self.texts = _Blob(path, "texts")
+        self.records = _Blob(path, "records")
+        self.centroids = None
+        if self.header.get("ann") == "ivf":
+            self.centroids = np.load(os.path.join(path, "ivf_centroids.npy"))
+            self.list_order = np.load(os.path.join(path, "ivf_order.npy"), mmap_mode="r")
+            self.list_offsets = np.load(os.path.join(path, "ivf_offsets.npy"))
+
+    def _score(self, start, stop, query):
+        """Cosine scores of the stored rows start..stop against a unit query."""
+        # einsum converts in small buffered blocks, much faster than astype() on the whole slice
+        scores = np.einsum("ij,j->i", self.vectors[start:stop], query)
+        if self.scales is not None:
+            scores *= self.scales[start:stop]
+        return scores
+
+    def _exact(self, query, k):
+        best_rows = np.zeros(0, dtype=np.int64)
+        best_scores = np.zeros(0, dtype=np.float32)
+        for start in range(0, self.count, SEARCH_BLOCK_ROWS):
+            stop = min(start + SEARCH_BLOCK_ROWS, self.count)
+            scores = self._score(start, stop, query)
+            top = _top_k(scores, k)
+            best_rows = np.concatenate([best_rows, top + start])
+            best_scores = np.concatenate([best_scores, scores[top]])
+        return best_rows, best_scores
+
+    def _ivf(self, query, k):
+        lists = _top_k(self.centroids @ query, self.nprobe)
+        starts = self.list_offsets[lists]
+        stops = self.list_offsets[lists + 1]
+        if int((stops - starts).sum()) < k:
+            # Too few candidates in the probed lists; fall back to scanning everything
+            rows, scores = self._exact(query, k)
+        else:
+            rows = np.concatenate([np.arange(start, stop) for start, stop in zip(starts, stops)])
+            scores = np.concatenate([self._score(start, stop, query) for start, stop in zip(starts, stops)])
+        # Vectors are stored list by list; map back to the rows of texts and records
+        return self.list_order[rows], scores
+
+    def search(self, embedding, k=4):
+        """Returns [(row, cosine similarity)] for the k nearest vectors, best first."""
+        if not self.count:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        rows, scores = self._ivf(query, k) if self.centroids is not None else self._exact(query, k)
+        top = _top_k(scores, k)
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(rows[i]), float(scores[i])) for i in top]
+
+    def document(self, row):
+        record = json.loads(self.records[row])
+        return Document(id=record["id"], page_content=self.texts[row].decode("utf-8"), metadata=record["metadata"])
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k=4):
+        """Same shape as langchain_chroma's method: [(Document, score)], best first."""
+        return [(self.document(row), score) for row, score in self.search(embedding, k)]
+
+
+def _top_k(scores, k):
+    """Indexes of the k largest scores, in no particular order."""
+    if k >= len(scores):
+        return np.arange(len(scores))
+    return np.argpartition(-scores, k - 1)[:k]
+
+
+def open_vector_store(chroma_path, collection_name):
+    """Opens a collection's export, or returns None if it has none."""
+    path = vector_store_path(chroma_path, collection_name)
+    if not os.path.exists(os.path.join(path, "header.json")):
+        return None
+    return MmapVectorStore(path)
@@ -0,0 +1,74 @@
+"""Warm-up at server start, so the first question after a deploy or restart is as fast as the rest.
+
+Opens the shared retriever of the event collection (Chroma or its mmap
+export), runs one search so the vector data is loaded, builds the pooled
+Gemini client and compiles the prompt templates. How long each step took,
+and how long the app's imports took, is printed and recorded as a "warmup"
+trace plus an "imports" measurement in tracing.py, so cold-start regressions
+show up on the metrics endpoint and in the trace log.
+
+Streamlit only runs app.py once a browser connects, so the app starts the
+warm-up in a background thread on its first run: the page renders right
+away, and a question asked before it is done waits for the store to open
+instead of opening it a second time.
+"""
+import threading
+
+from api_clients import get_genai_client
+from rag_bot import PROMPT_TEMPLATES, get_compiled_prompt
+from retriever import DEFAULT_COLLECTION, get_shared_retriever
+from tracing import Trace, tracer
+
+_started = False
+_started_lock = threading.Lock()
+last_report = None  # The last warm-up trace, as a dict
+
+
+def warm_up(chroma_path, api_key, collection_name=DEFAULT_COLLECTION, embedding_provider=None, import_seconds=None):
+    """Runs every warm-up step now and returns the trace as a dict.
+
+    Failures are reported, not raised: the first question then simply does
+    the work itself.
+    """
+    global last_report
+    trace = Trace("warmup", collection=collection_name)
+    if import_seconds is not None:
+        trace.attributes["import_seconds"] = import_seconds
+        tracer.observe("imports", import_seconds)
+    try:
+        with trace.span("warmup_client"):
+            get_genai_client(api_key)
+        retriever = get_shared_retriever(chroma_path, api_key, embedding_provider, collection_name)
+        with trace.span("warmup_open") as span:
+            db, span["cold"] = retriever.get_db()
+            span["store"] = type(db).__name__
+        with trace.span("warmup_vectors") as span:
+            span["vectors"] = retriever.load_vectors()
+        with trace.span("warmup_prompts") as span:
+            for template_type in PROMPT_TEMPLATES:
+                get_compiled_prompt(template_type)
+            span["templates"] = len(PROMPT_TEMPLATES)
+    except Exception as e:
+        trace.attributes["error"] = f"{type(e).__name__}: {e}"
+    tracer.record(trace)
+    last_report = trace.to_dict()
+
+    steps = ", ".join(f"{span['name'][len('warmup_'):]} {span['duration']:.2f}s" for span in trace.spans)
+    imports = f"imports took {import_seconds:.2f}s; " if import_seconds is not None else ""
+    error = trace.attributes.get("error")
+    print(f"Warm-up {'failed (' + error + ')' if error else 'finished'}: {imports}"
+          f"warm-up took {trace.duration:.2f}s ({steps})")
+    return last_report
+
+
+def start_warm_up(chroma_path, api_key, **options):
+    """Runs warm_up in a background thread, once per process; returns whether this call started it."""
+    global _started
+    with _started_lock:
+        if _started:
+            return False
+        _started = True
+    threading.Thread(
+        target=warm_up, args=(chroma_path, api_key), kwargs=options, daemon=True, name="warmup"
+    ).start()
+    return True